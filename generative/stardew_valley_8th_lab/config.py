@@ -2,14 +2,33 @@ API_URL = "https://stardewvalleywiki.com/mediawiki/api.php"
 USER_AGENT = "Mozilla/5.0 (compatible; StardewGenDataset/1.0)"
 
 OUT_DIR = "dataset"
-IMAGES_DIR = f"{OUT_DIR}/images_48"
+IMAGES_DIR = f"{OUT_DIR}/images_{{size}}"
+BLOBS_DIR = f"{OUT_DIR}/blobs"
 META_CSV = f"{OUT_DIR}/metadata.csv"
+CACHE_PATH = f"{OUT_DIR}/api_cache.sqlite"
+STATE_PATH = f"{OUT_DIR}/sync_state.json"
+FAILED_CSV = f"{OUT_DIR}/failed.csv"
+JOURNAL_PATH = f"{OUT_DIR}/journal.jsonl"
+EXPORT_DIR = f"{OUT_DIR}/arrays_48"
 
 MAX_WORKERS = 8
+PROCESS_WORKERS = None
 MAX_RETRIES = 8
+CRAWL_WORKERS = 8
+API_RATE_LIMIT = 10.0
+DOWNLOAD_RATE_LIMIT = None
+CACHE_TTL = 7 * 24 * 3600
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_OFFLINE = False
 IMAGEINFO_BATCH_SIZE = 50
 DOWNLOAD_QUEUE_LIMIT = 300
+PIPELINE_REPORT_INTERVAL = 15.0
+PHASH_KIND = "phash"
+PHASH_RADIUS = 6
 TARGET_SIZE = 48
+DERIVATIVES = [(48, "png")]
+EXPORT_SIZE = 48
+EXPORT_SHARD_BYTES = 512 * 1024 * 1024
 MAX_ORIG_WIDTH = 600
 MAX_ORIG_HEIGHT = 600
 MAX_IMAGES_TOTAL = 50000
@@ -1,17 +1,46 @@
+import argparse
+
 import config
+from stardew.array_export import export_arrays
+from stardew.blob_store import BlobStore
+from stardew.http_pool import HttpPool
+from stardew.rate_limit import AdaptiveLimiter
+from stardew.response_cache import ResponseCache
 from stardew.stardew_wiki_api import WikiAPI
-from stardew.dataset_builder import build_generative_dataset
+from stardew.dataset_builder import build_generative_dataset, derivative_column
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--incremental", action="store_true",
+                    help="only fetch files uploaded or changed since the last sync watermark")
+    ap.add_argument("--resume", action="store_true",
+                    help="replay the build journal left by an interrupted run instead of starting over")
+    return ap.parse_args()
+
+
+def export_column():
+    fmts = [fmt for size, fmt in config.DERIVATIVES if size == config.EXPORT_SIZE]
+    if not fmts:
+        raise SystemExit(f"EXPORT_SIZE={config.EXPORT_SIZE} has no entry in DERIVATIVES={config.DERIVATIVES}; "
+                         f"add ({config.EXPORT_SIZE}, 'png') or set EXPORT_DIR = None")
+    return derivative_column(config.EXPORT_SIZE, "png" if "png" in fmts else fmts[0])
 
 
 def main():
-    api = WikiAPI(config.API_URL, config.USER_AGENT, max_retries=config.MAX_RETRIES)
+    args = parse_args()
+    column = export_column() if config.EXPORT_DIR else None
+    pool = HttpPool(config.USER_AGENT, pool_size=config.MAX_WORKERS + config.CRAWL_WORKERS)
+    cache = ResponseCache(config.CACHE_PATH, ttl=config.CACHE_TTL, max_bytes=config.CACHE_MAX_BYTES,
+                          offline=config.CACHE_OFFLINE)
+    api = WikiAPI(config.API_URL, config.USER_AGENT, max_retries=config.MAX_RETRIES, pool=pool, cache=cache,
+                  limiter=AdaptiveLimiter(rate=config.API_RATE_LIMIT, max_concurrency=config.CRAWL_WORKERS))
 
     build_generative_dataset(
         api=api,
         categories=config.CATEGORIES,
         images_dir=config.IMAGES_DIR,
         meta_csv=config.META_CSV,
-        user_agent=config.USER_AGENT,
         max_workers=config.MAX_WORKERS,
         batch_size=config.IMAGEINFO_BATCH_SIZE,
         queue_limit=config.DOWNLOAD_QUEUE_LIMIT,
@@ -21,8 +50,31 @@ def main():
         max_total=config.MAX_IMAGES_TOTAL,
         max_orig_w=config.MAX_ORIG_WIDTH,
         max_orig_h=config.MAX_ORIG_HEIGHT,
+        crawl_workers=config.CRAWL_WORKERS,
+        state_path=config.STATE_PATH,
+        incremental=args.incremental,
+        report_interval=config.PIPELINE_REPORT_INTERVAL,
+        failed_csv=config.FAILED_CSV,
+        store=BlobStore(config.BLOBS_DIR),
+        phash_kind=config.PHASH_KIND,
+        phash_radius=config.PHASH_RADIUS,
+        process_workers=config.PROCESS_WORKERS,
+        derivatives=config.DERIVATIVES,
+        journal_path=config.JOURNAL_PATH,
+        resume=args.resume,
+        limiter=AdaptiveLimiter(rate=config.DOWNLOAD_RATE_LIMIT, max_concurrency=config.MAX_WORKERS),
     )
 
+    if config.EXPORT_DIR:
+        print("Arrays:", export_arrays(
+            config.META_CSV,
+            config.EXPORT_DIR,
+            size=config.EXPORT_SIZE,
+            column=column,
+            shard_bytes=config.EXPORT_SHARD_BYTES,
+            workers=config.MAX_WORKERS,
+        ))
+
 
 if __name__ == "__main__":
     main()
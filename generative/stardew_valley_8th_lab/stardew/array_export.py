@@ -0,0 +1,112 @@
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+INT_COLUMNS = {"orig_width", "orig_height", "orig_bytes", "dup_cluster"}
+MANIFEST = "manifest.json"
+
+
+def _decode_into(out: np.ndarray, path: str, size: int) -> bool:
+    try:
+        with Image.open(path) as im:
+            if getattr(im, "is_animated", False):
+                im.seek(0)
+            im = im.convert("RGB")
+            if im.size != (size, size):
+                im = ImageOps.pad(im, (size, size), method=Image.Resampling.LANCZOS, color=(255, 255, 255))
+            out[...] = np.asarray(im, dtype=np.uint8)
+            return True
+    except Exception:
+        return False
+
+
+def _write_shard(ex: ThreadPoolExecutor, path: str, paths: List[str], size: int) -> List[bool]:
+    tmp = path + ".part"
+    arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(len(paths), size, size, 3))
+    ok = list(ex.map(_decode_into, arr, paths, [size] * len(paths)))
+    arr.flush()
+    del arr
+    os.replace(tmp, path)
+    return ok
+
+
+def _column_array(name: str, values: List[str]) -> np.ndarray:
+    if name in INT_COLUMNS:
+        return np.array([int(v) if v not in (None, "") else -1 for v in values], dtype=np.int64)
+    return np.array([v or "" for v in values], dtype=np.str_)
+
+
+def export_arrays(
+    meta_csv: str,
+    out_dir: str,
+    size: int = 48,
+    column: str = "image_path",
+    shard_bytes: Optional[int] = None,
+    workers: int = 8,
+) -> Dict:
+    with open(meta_csv, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames or [])
+        rows = [r for r in reader if r.get(column) and os.path.exists(r[column])]
+
+    os.makedirs(out_dir, exist_ok=True)
+    item_bytes = size * size * 3
+    per_shard = max(1, shard_bytes // item_bytes) if shard_bytes else max(1, len(rows))
+
+    shards: List[Dict] = []
+    shard_of = np.zeros(len(rows), dtype=np.int32)
+    offset_of = np.zeros(len(rows), dtype=np.int64)
+    valid = np.zeros(len(rows), dtype=bool)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for k, start in enumerate(range(0, len(rows), per_shard)):
+            chunk = rows[start:start + per_shard]
+            name = f"images-{k:05d}.npy"
+            ok = _write_shard(ex, os.path.join(out_dir, name), [r[column] for r in chunk], size)
+
+            shard_of[start:start + len(chunk)] = k
+            offset_of[start:start + len(chunk)] = np.arange(len(chunk))
+            valid[start:start + len(chunk)] = ok
+            shards.append({"path": name, "rows": len(chunk)})
+
+    keep = {s["path"] for s in shards}
+    for stale in glob.glob(os.path.join(out_dir, "images-*.npy")):
+        if os.path.basename(stale) not in keep:
+            os.remove(stale)
+
+    columns = {name: _column_array(name, [r.get(name) for r in rows]) for name in fieldnames}
+    columns.update(shard=shard_of, offset=offset_of, valid=valid)
+    tmp = os.path.join(out_dir, "metadata.npz.part")
+    with open(tmp, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp, os.path.join(out_dir, "metadata.npz"))
+
+    manifest = {
+        "count": len(rows),
+        "shape": [size, size, 3],
+        "dtype": "uint8",
+        "source_column": column,
+        "columns": sorted(columns),
+        "shards": shards,
+    }
+    tmp = os.path.join(out_dir, MANIFEST + ".part")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+    return {"rows": len(rows), "invalid": int((~valid).sum()), "shards": len(shards)}
+
+
+def load_arrays(out_dir: str) -> Tuple[List[np.ndarray], Dict[str, np.ndarray]]:
+    with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    shards = [np.load(os.path.join(out_dir, s["path"]), mmap_mode="r") for s in manifest["shards"]]
+    with np.load(os.path.join(out_dir, "metadata.npz")) as z:
+        columns = {name: z[name] for name in z.files}
+    return shards, columns
@@ -1,43 +1,91 @@
 import os
 import csv
 import re
-from typing import Dict, List, Tuple, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import multiprocessing
+from typing import Dict, List, Optional, Tuple, Set
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from .stardew_wiki_api import WikiAPI
-from .downloader import download_and_process
+from .downloader import SAVE_FORMATS, fetch_with_retries, render_derivatives, write_atomic
+from .blob_store import BlobStore
+from .journal import Journal
+from .http_pool import HttpPool
+from .pipeline import Channel, Pipeline, Timings
+from .rate_limit import AdaptiveLimiter
+from .phash import annotate_metadata
+from .sync_state import SyncDelta, load_watermark, read_metadata, save_watermark, utc_now_iso
 
 META_FIELDS = [
     "image_path", "source_category", "file_title", "url",
     "orig_mime", "orig_width", "orig_height", "orig_bytes",
+    "phash", "dup_cluster",
 ]
 
 _DIALOGUE_RE = re.compile(r"(dialogue|textbox|conversation|ui|window|box|menu)", re.IGNORECASE)
 
 ALLOWED_MIME = {"image/png", "image/jpeg", "image/webp", "image/gif"}
 
+Derivative = Tuple[int, str]
 
-def collect_file_titles(api: WikiAPI, roots: List[str], max_depth: int) -> List[Tuple[str, str]]:
+
+def derivative_column(size: int, fmt: str) -> str:
+    return f"image_{size}_{fmt}"
+
+
+def derivative_paths(images_dir: str, derivatives: List[Derivative], digest: str) -> List[str]:
+    return [os.path.join(images_dir.format(size=size), f"{digest}.{fmt}") for size, fmt in derivatives]
+
+
+def set_image_paths(row: Dict, derivatives: List[Derivative], paths: List[str]) -> Dict:
+    row["image_path"] = paths[0]
+    for (size, fmt), path in zip(derivatives, paths):
+        row[derivative_column(size, fmt)] = path
+    return row
+
+
+def has_all_derivatives(row: Dict, derivatives: List[Derivative]) -> bool:
+    for size, fmt in derivatives:
+        path = row.get(derivative_column(size, fmt))
+        if not path or not os.path.exists(path):
+            return False
+    return True
+
+
+def _list_members(api: WikiAPI, cat: str) -> List[Dict]:
+    return list(api.iter_category_members(cat))
+
+
+def collect_file_titles(api: WikiAPI, roots: List[str], max_depth: int, workers: int = 1) -> List[Tuple[str, str]]:
     seen = set()
-    q = [(c, 0) for c in roots]
+    level = list(roots)
+    depth = 0
     out: List[Tuple[str, str]] = []
 
-    while q:
-        cat, depth = q.pop(0)
-        if cat in seen:
-            continue
-        seen.add(cat)
-
-        for item in api.iter_category_members(cat):
-            ns = item.get("ns")
-            title = item.get("title", "")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while level:
+            cats = []
+            for cat in level:
+                if cat not in seen:
+                    seen.add(cat)
+                    cats.append(cat)
+
+            futs = [ex.submit(_list_members, api, cat) for cat in cats]
+            next_level = []
+            for cat, fut in zip(cats, futs):
+                for item in fut.result():
+                    ns = item.get("ns")
+                    title = item.get("title", "")
+
+                    if ns == 14 and depth < max_depth:
+                        next_level.append(title)
+                        continue
 
-            if ns == 14 and depth < max_depth:
-                q.append((title, depth + 1))
-                continue
+                    if ns == 6 and title.startswith("File:"):
+                        out.append((cat, title))
 
-            if ns == 6 and title.startswith("File:"):
-                out.append((cat, title))
+            level = next_level
+            depth += 1
 
     return out
 
@@ -64,14 +112,193 @@ def is_bad_for_generative(file_title: str, info: Dict, max_w: int, max_h: int) -
     return False
 
 
-def flush(writer: csv.DictWriter, futures: Dict) -> int:
-    wrote = 0
-    for fut in as_completed(list(futures.keys())):
-        row = futures.pop(fut)
-        row["image_path"] = fut.result()
-        writer.writerow(row)
-        wrote += 1
-    return wrote
+def discover_stage(
+    api: WikiAPI,
+    categories: List[str],
+    max_depth: int,
+    crawl_workers: int,
+    derivatives: List[Derivative],
+    delta: Optional[SyncDelta],
+    journal: Journal,
+    titles: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        candidates = journal.state.titles.get("*")
+        if candidates is None:
+            candidates = collect_file_titles(api, categories, max_depth=max_depth, workers=crawl_workers)
+            journal.titles("*", candidates)
+        if delta is not None:
+            # new uploads are queued first, as in the image builder; build a new list,
+            # the journal's copy must stay as recorded
+            candidates = [*delta.extra_members(categories, candidates), *candidates]
+
+        seen_files: Set[str] = set()
+        uniq: List[Tuple[str, str]] = []
+        for cat, ft in candidates:
+            if ft in seen_files:
+                continue
+            seen_files.add(ft)
+            uniq.append((cat, ft))
+
+        print("Candidates:", len(uniq))
+
+        for cat, ft in uniq:
+            known = journal.state.done_row(ft)
+            if known is None and delta is not None:
+                known = delta.reusable_row(ft)
+            if known is not None and has_all_derivatives(known, derivatives):
+                ok = rows.put(dict(known, source_category=cat))
+            else:
+                ok = titles.put((cat, ft))
+            if not ok:
+                return
+    finally:
+        titles.close()
+        rows.close()
+
+
+def imageinfo_stage(
+    api: WikiAPI,
+    store: BlobStore,
+    images_dir: str,
+    derivatives: List[Derivative],
+    batch_size: int,
+    max_orig_w: int,
+    max_orig_h: int,
+    delta: Optional[SyncDelta],
+    journal: Journal,
+    titles: Channel,
+    downloads: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        for chunk in titles.batches(batch_size):
+            lookup = [ft for _, ft in chunk if delta is None or ft not in delta.changed]
+            infos = {ft: journal.state.infos[ft] for ft in lookup if ft in journal.state.infos}
+            lookup = [ft for ft in lookup if ft not in infos]
+            if lookup:
+                fetched = api.imageinfo_batch(lookup, batch_size=batch_size)
+                journal.infos(fetched)
+                infos.update(fetched)
+            if delta is not None:
+                infos.update({ft: delta.changed[ft] for _, ft in chunk if ft in delta.changed})
+
+            for cat, ft in chunk:
+                info = infos.get(ft)
+                if not info:
+                    continue
+
+                if is_bad_for_generative(ft, info, max_orig_w, max_orig_h):
+                    continue
+
+                url = info.get("url")
+                if not url:
+                    continue
+
+                row = {
+                    "image_path": "",
+                    "source_category": cat,
+                    "file_title": ft,
+                    "url": url,
+                    "orig_mime": info.get("mime"),
+                    "orig_width": info.get("width"),
+                    "orig_height": info.get("height"),
+                    "orig_bytes": info.get("size"),
+                }
+
+                force = delta is not None and ft in delta.changed
+                digest = None if force else store.lookup(url, info.get("size"))
+                paths = derivative_paths(images_dir, derivatives, digest) if digest else []
+
+                if paths and all(os.path.exists(p) for p in paths):
+                    ok = rows.put(set_image_paths(row, derivatives, paths))
+                else:
+                    ok = downloads.put((row, url, force))
+                if not ok:
+                    return
+    finally:
+        downloads.close()
+        rows.close()
+
+
+def download_stage(
+    pool: HttpPool,
+    store: BlobStore,
+    limiter: AdaptiveLimiter,
+    images_dir: str,
+    derivatives: List[Derivative],
+    max_retries: int,
+    timings: Timings,
+    downloads: Channel,
+    jobs: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        for row, url, force in downloads:
+            t0 = time.monotonic()
+            data = None
+            try:
+                digest = None if force else store.lookup(url)
+                if digest is None:
+                    data = fetch_with_retries(url, pool, max_retries, limiter)
+                    digest = store.put(url, data)
+            except RuntimeError as e:
+                row["error"] = str(e)
+            timings.record(time.monotonic() - t0)
+
+            if row.get("error"):
+                ok = rows.put(row)
+            else:
+                paths = derivative_paths(images_dir, derivatives, digest)
+                if all(os.path.exists(p) for p in paths):
+                    ok = rows.put(set_image_paths(row, derivatives, paths))
+                else:
+                    ok = jobs.put((row, data if data is not None else store.read(digest), paths))
+            if not ok:
+                return
+    finally:
+        jobs.close()
+        rows.close()
+
+
+def process_stage(
+    px: ProcessPoolExecutor,
+    derivatives: List[Derivative],
+    timings: Timings,
+    jobs: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        for row, data, paths in jobs:
+            t0 = time.monotonic()
+            try:
+                missing = [i for i, p in enumerate(paths) if not os.path.exists(p)]
+                if missing:
+                    rendered = px.submit(render_derivatives, data, [derivatives[i] for i in missing]).result()
+                    for i, out in zip(missing, rendered):
+                        write_atomic(paths[i], out)
+                set_image_paths(row, derivatives, paths)
+            except Exception as e:
+                row["error"] = f"Processing failed: {e}"
+            timings.record(time.monotonic() - t0)
+            if not rows.put(row):
+                return
+    finally:
+        rows.close()
+
+
+def load_delta(api: WikiAPI, meta_csv: str, state_path: str, batch_size: int) -> Optional[SyncDelta]:
+    watermark = load_watermark(state_path)
+    known = read_metadata(meta_csv)
+    if watermark is None or not known:
+        print("Incremental: no previous sync, running a full build")
+        return None
+
+    changed = {item["title"]: item for item in api.iter_changed_files(watermark) if item.get("title")}
+    categories = api.categories_batch(list(changed), batch_size=batch_size) if changed else {}
+    print(f"Incremental: {len(changed)} files changed since {watermark}")
+    return SyncDelta(known=known, changed=changed, categories=categories)
 
 
 def build_generative_dataset(
@@ -79,7 +306,6 @@ def build_generative_dataset(
     categories: List[str],
     images_dir: str,
     meta_csv: str,
-    user_agent: str,
     max_workers: int,
     batch_size: int,
     queue_limit: int,
@@ -89,77 +315,111 @@ def build_generative_dataset(
     max_total: int,
     max_orig_w: int,
     max_orig_h: int,
+    crawl_workers: int = 1,
+    state_path: Optional[str] = None,
+    incremental: bool = False,
+    report_interval: Optional[float] = None,
+    failed_csv: Optional[str] = None,
+    store: Optional[BlobStore] = None,
+    phash_kind: Optional[str] = "phash",
+    phash_radius: int = 6,
+    process_workers: Optional[int] = None,
+    derivatives: Optional[List[Derivative]] = None,
+    journal_path: Optional[str] = None,
+    resume: bool = False,
+    limiter: Optional[AdaptiveLimiter] = None,
 ) -> None:
-    os.makedirs(images_dir, exist_ok=True)
-
-    candidates = collect_file_titles(api, categories, max_depth=max_depth)
-
-    seen_files: Set[str] = set()
-    uniq: List[Tuple[str, str]] = []
-    for cat, ft in candidates:
-        if ft in seen_files:
-            continue
-        seen_files.add(ft)
-        uniq.append((cat, ft))
-
-    print("Candidates:", len(uniq))
+    limiter = limiter or AdaptiveLimiter(max_concurrency=max_workers)
+    derivatives = derivatives or [(target_size, "png")]
+    for size, fmt in derivatives:
+        if fmt not in SAVE_FORMATS:
+            raise ValueError(f"Unsupported derivative format: {fmt}")
+    if len({size for size, _ in derivatives}) > 1 and "{size}" not in images_dir:
+        raise ValueError("images_dir must contain '{size}' when several target sizes are requested")
+    image_dirs = sorted({images_dir.format(size=size) for size, _ in derivatives})
+    for d in image_dirs:
+        os.makedirs(d, exist_ok=True)
+    fieldnames = META_FIELDS[:1] + [derivative_column(size, fmt) for size, fmt in derivatives] + META_FIELDS[1:]
+    process_workers = process_workers or os.cpu_count() or 1
+    failed_csv = failed_csv or os.path.join(os.path.dirname(meta_csv), "failed.csv")
+    store = store or BlobStore(os.path.join(os.path.dirname(meta_csv), "blobs"))
+    journal = Journal(journal_path or os.path.join(os.path.dirname(meta_csv), "journal.jsonl"), resume=resume)
+    if resume:
+        print(f"Resume: {len(journal.state.infos)} imageinfos, {len(journal.state.rows)} rows done")
+
+    started = utc_now_iso()
+    delta = load_delta(api, meta_csv, state_path, batch_size) if incremental and state_path else None
+
+    px = ProcessPoolExecutor(max_workers=process_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    pipe = Pipeline()
+    titles = pipe.channel("titles", maxsize=batch_size * 4)
+    downloads = pipe.channel("downloads", maxsize=queue_limit)
+    jobs = pipe.channel("process", maxsize=process_workers * 4, producers=max_workers)
+    rows = pipe.channel("rows", maxsize=queue_limit, producers=2 + max_workers + process_workers)
+
+    pipe.spawn("discover", discover_stage, api, categories, max_depth, crawl_workers, derivatives, delta,
+               journal, titles, rows)
+    pipe.spawn("imageinfo", imageinfo_stage, api, store, images_dir, derivatives, batch_size, max_orig_w,
+               max_orig_h, delta, journal, titles, downloads, rows)
+    timings = Timings()
+    process_timings = Timings()
+    for i in range(max_workers):
+        pipe.spawn(f"download-{i}", download_stage, api.pool, store, limiter, images_dir, derivatives, max_retries,
+                   timings, downloads, jobs, rows)
+    for i in range(process_workers):
+        pipe.spawn(f"process-{i}", process_stage, px, derivatives, process_timings, jobs, rows)
+    pipe.monitor(report_interval)
 
     written = 0
-    with open(meta_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=META_FIELDS)
-        writer.writeheader()
-
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            futures: Dict = {}
-
-            for i in range(0, len(uniq), batch_size):
-                chunk = uniq[i:i + batch_size]
-                titles = [ft for _, ft in chunk]
-                infos = api.imageinfo_batch(titles, batch_size=batch_size)
-
-                for cat, ft in chunk:
-                    info = infos.get(ft)
-                    if not info:
-                        continue
-
-                    if is_bad_for_generative(ft, info, max_orig_w, max_orig_h):
-                        continue
-
-                    url = info.get("url")
-                    if not url:
-                        continue
-
-                    out_path = os.path.join(images_dir, f"{hash(url)}.png")
-
-                    row = {
-                        "image_path": "",
-                        "source_category": cat,
-                        "file_title": ft,
-                        "url": url,
-                        "orig_mime": info.get("mime"),
-                        "orig_width": info.get("width"),
-                        "orig_height": info.get("height"),
-                        "orig_bytes": info.get("size"),
-                    }
-
-                    if os.path.exists(out_path):
-                        row["image_path"] = out_path
-                        writer.writerow(row)
-                        written += 1
-                    else:
-                        fut = ex.submit(download_and_process, url, out_path, user_agent, max_retries, target_size)
-                        futures[fut] = row
-
-                    if len(futures) >= queue_limit:
-                        written += flush(writer, futures)
-                        if max_total and written >= max_total:
-                            break
-
+    failed = 0
+    tmp_csv = meta_csv + ".part"
+    try:
+        with open(tmp_csv, "w", newline="", encoding="utf-8") as f, \
+                open(failed_csv, "w", newline="", encoding="utf-8") as ff:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            failed_writer = csv.DictWriter(ff, fieldnames=fieldnames + ["error"], extrasaction="ignore")
+            failed_writer.writeheader()
+
+            for row in rows:
+                if row.get("error"):
+                    failed_writer.writerow(row)
+                    failed += 1
+                    continue
+                writer.writerow(row)
+                journal.row(row)
+                written += 1
                 if max_total and written >= max_total:
+                    pipe.stop.set()
                     break
-
-            written += flush(writer, futures)
+        pipe.join()
+    except BaseException:
+        pipe.stop.set()
+        journal.close()
+        raise
+    finally:
+        px.shutdown(cancel_futures=True)
+
+    os.replace(tmp_csv, meta_csv)
+    if phash_kind:
+        print("Near-duplicates:", annotate_metadata(meta_csv, kind=phash_kind, radius=phash_radius))
+    if state_path:
+        save_watermark(state_path, started)
+    journal.finish()
 
     print("DONE:", written)
-    print("Images:", images_dir)
-    print("Metadata:", meta_csv)
\ No newline at end of file
+    print("Failed:", failed)
+    if failed:
+        print("Failures:", failed_csv)
+    print("Download latency:", timings.summary())
+    print("Processing latency:", process_timings.summary())
+    print("Images:", ", ".join(image_dirs))
+    print("Metadata:", meta_csv)
+    print("HTTP:", api.pool.stats())
+    print("API limiter:", api.limiter.stats())
+    print("Download limiter:", limiter.stats())
+    print("Blob store:", store.stats())
+    if api.cache is not None:
+        print("API cache:", api.cache.stats())
+    print("Pipeline:", pipe.metrics())
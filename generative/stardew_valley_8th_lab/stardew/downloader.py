@@ -1,15 +1,27 @@
+import io
 import os
+import threading
 import time
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import requests
 from PIL import Image, ImageOps
 
+from .http_pool import HttpPool
+from .rate_limit import THROTTLE_STATUS, AdaptiveLimiter, parse_retry_after
+
 RETRYABLE_STATUS = {429, 502, 503, 504}
 
 
-def _save_as_48px_png(src_path: str, dst_path: str, target_size: int) -> None:
-    with Image.open(src_path) as im:
+SAVE_FORMATS = {
+    "png": ("PNG", {"optimize": True}),
+    "webp": ("WEBP", {"lossless": True}),
+    "jpg": ("JPEG", {"quality": 95}),
+}
+
+
+def render_derivatives(data: bytes, targets: List[Tuple[int, str]]) -> List[bytes]:
+    with Image.open(io.BytesIO(data)) as im:
         if getattr(im, "is_animated", False):
             im.seek(0)
 
@@ -23,48 +35,61 @@ def _save_as_48px_png(src_path: str, dst_path: str, target_size: int) -> None:
         else:
             im = im.convert("RGB")
 
-        im = ImageOps.pad(im, (target_size, target_size), method=Image.Resampling.LANCZOS, color=(255, 255, 255))
-        im.save(dst_path, format="PNG", optimize=True)
+        out: List[bytes] = []
+        for size, fmt in targets:
+            pil_format, opts = SAVE_FORMATS[fmt]
+            resized = ImageOps.pad(im, (size, size), method=Image.Resampling.LANCZOS, color=(255, 255, 255))
+            buf = io.BytesIO()
+            resized.save(buf, format=pil_format, **opts)
+            out.append(buf.getvalue())
+        return out
 
 
-def download_and_process(url: str, out_png_path: str, user_agent: str, max_retries: int, target_size: int) -> str:
+def fetch_with_retries(url: str, pool: HttpPool, max_retries: int = 8,
+                       limiter: Optional[AdaptiveLimiter] = None) -> bytes:
+    limiter = limiter or AdaptiveLimiter()
     last_err: Optional[Exception] = None
 
     for attempt in range(max_retries):
-        try:
-            s = requests.Session()
-            s.headers.update({"User-Agent": user_agent, "Connection": "close"})
-            with s.get(url, stream=True, timeout=60) as r:
-                if r.status_code in RETRYABLE_STATUS:
-                    time.sleep(min(20.0, 2 ** attempt))
-                    continue
-                r.raise_for_status()
-
-                tmp_raw = out_png_path + ".raw.part"
-                tmp_png = out_png_path + ".png.part"
-
-                with open(tmp_raw, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024 * 128):
-                        if chunk:
-                            f.write(chunk)
-
-                _save_as_48px_png(tmp_raw, tmp_png, target_size)
-
-                os.replace(tmp_png, out_png_path)
-                try:
-                    os.remove(tmp_raw)
-                except OSError:
-                    pass
-
-                return out_png_path
-
-        except (requests.exceptions.SSLError,
-                requests.exceptions.ConnectionError,
-                requests.exceptions.Timeout) as e:
-            last_err = e
-            time.sleep(min(20.0, 2 ** attempt))
-        except Exception as e:
-            last_err = e
-            time.sleep(min(10.0, 2 ** attempt))
+        delay = 0.0
+        with limiter.slot():
+            t0 = time.monotonic()
+            try:
+                with pool.get(url, stream=True, timeout=60) as r:
+                    if r.status_code in THROTTLE_STATUS:
+                        retry_after = parse_retry_after(r.headers)
+                        last_err = RuntimeError(f"HTTP {r.status_code} (Retry-After: {retry_after})")
+                        limiter.throttled(attempt, retry_after, started=t0)
+                        continue
+                    if r.status_code in RETRYABLE_STATUS:
+                        last_err = RuntimeError(f"HTTP {r.status_code}")
+                        delay = limiter.failed(attempt, started=t0)
+                    else:
+                        r.raise_for_status()
+
+                        buf = bytearray()
+                        for chunk in r.iter_content(chunk_size=1024 * 128):
+                            if chunk:
+                                buf += chunk
+                        limiter.success(time.monotonic() - t0)
+                        return bytes(buf)
+
+            except (requests.exceptions.SSLError,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                last_err = e
+                delay = limiter.failed(attempt, started=t0)
+            except Exception as e:
+                last_err = e
+                delay = limiter.backoff(attempt)
+        time.sleep(delay)
 
     raise RuntimeError(f"Download failed after retries: {last_err}")
+
+
+def write_atomic(path: str, data: bytes) -> str:
+    tmp = f"{path}.{threading.get_ident()}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,46 @@
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpPool:
+    def __init__(self, user_agent: str, pool_size: int = 8):
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        s = getattr(self._local, "s", None)
+        if s is None:
+            s = requests.Session()
+            s.headers.update({"User-Agent": self.user_agent, "Connection": "keep-alive"})
+            s.mount("https://", self.adapter)
+            s.mount("http://", self.adapter)
+            self._local.s = s
+        return s
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session().get(url, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        pools = self.adapter.poolmanager.pools
+        requests_made = 0
+        handshakes = 0
+        for key in pools.keys():
+            try:
+                p = pools[key]
+            except KeyError:
+                continue
+            requests_made += p.num_requests
+            handshakes += p.num_connections
+        return {
+            "requests": requests_made,
+            "handshakes": handshakes,
+            "reused": max(0, requests_made - handshakes),
+        }
+
+    def close(self) -> None:
+        self.adapter.close()
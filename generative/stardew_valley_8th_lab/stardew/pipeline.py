@@ -0,0 +1,177 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_DONE = object()
+
+
+class Channel:
+    def __init__(self, name: str, maxsize: int, stop: threading.Event, producers: int = 1):
+        self.name = name
+        self.maxsize = maxsize
+        self.puts = 0
+        self.gets = 0
+        self.max_depth = 0
+        self._q: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._stop = stop
+        self._producers = producers
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            with self._lock:
+                self.puts += 1
+                self.max_depth = max(self.max_depth, self.puts - self.gets)
+            return True
+        return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._producers -= 1
+            last = self._producers == 0
+        if not last:
+            return
+        # never block here: a stopped or failed pipeline may have nobody draining the queue,
+        # so consumers also treat "closed and empty" as the end
+        self._closed = True
+        self._put_done()
+
+    def _put_done(self) -> None:
+        try:
+            self._q.put_nowait(_DONE)
+        except queue.Full:
+            pass
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            # read the flag before waiting: close() runs after the producer's last put, so an empty
+            # queue only means "done" if the channel was already closed when the get started
+            closed = self._closed
+            try:
+                item = self._q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set() or closed:
+                    return
+                continue
+            if item is _DONE:
+                self._put_done()
+                return
+            self._taken()
+            yield item
+
+    def batches(self, size: int, linger: float = 0.5) -> Iterator[List[Any]]:
+        batch: List[Any] = []
+        idle = 0.0
+        while True:
+            closed = self._closed
+            try:
+                item = self._q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                if closed:
+                    if batch:
+                        yield batch
+                    return
+                idle += 0.1
+                if batch and idle >= linger:
+                    yield batch
+                    batch = []
+                continue
+            if item is _DONE:
+                self._put_done()
+                if batch:
+                    yield batch
+                return
+            idle = 0.0
+            self._taken()
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+
+    def _taken(self) -> None:
+        with self._lock:
+            self.gets += 1
+
+    def depth(self) -> int:
+        return self.puts - self.gets
+
+
+class Pipeline:
+    def __init__(self):
+        self.stop = threading.Event()
+        self.channels: List[Channel] = []
+        self._threads: List[threading.Thread] = []
+        self._errors: List[BaseException] = []
+        self._finished = threading.Event()
+
+    def channel(self, name: str, maxsize: int, producers: int = 1) -> Channel:
+        ch = Channel(name, maxsize, self.stop, producers=producers)
+        self.channels.append(ch)
+        return ch
+
+    def spawn(self, name: str, fn: Callable, *args) -> None:
+        def run():
+            try:
+                fn(*args)
+            except BaseException as e:
+                self._errors.append(e)
+                self.stop.set()
+
+        t = threading.Thread(target=run, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def monitor(self, interval: Optional[float]) -> None:
+        if not interval:
+            return
+
+        def run():
+            while not self._finished.wait(interval):
+                print("Pipeline:", self.report())
+
+        threading.Thread(target=run, name="pipeline-monitor", daemon=True).start()
+
+    def join(self) -> None:
+        for t in self._threads:
+            t.join()
+        self._finished.set()
+        if self._errors:
+            raise self._errors[0]
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        return {
+            ch.name: {"depth": ch.depth(), "max_depth": ch.max_depth, "capacity": ch.maxsize, "items": ch.puts}
+            for ch in self.channels
+        }
+
+    def report(self) -> str:
+        return " ".join(f"{ch.name}={ch.depth()}/{ch.maxsize}" for ch in self.channels)
+
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: List[float] = []
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            xs = sorted(self._samples)
+        if not xs:
+            return {"count": 0}
+        return {
+            "count": len(xs),
+            "p50": round(xs[len(xs) // 2], 3),
+            "p95": round(xs[min(len(xs) - 1, int(len(xs) * 0.95))], 3),
+            "max": round(xs[-1], 3),
+        }
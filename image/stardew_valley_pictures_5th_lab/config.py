@@ -2,11 +2,27 @@ API_URL = "https://stardewvalleywiki.com/mediawiki/api.php"
 USER_AGENT = "Mozilla/5.0 (compatible; StardewWikiImageParser/1.1)"
 OUT_DIR = "dataset"
 IMAGES_ROOT = f"{OUT_DIR}/images"
+BLOBS_DIR = f"{OUT_DIR}/blobs"
 META_CSV = f"{OUT_DIR}/metadata.csv"
+CACHE_PATH = f"{OUT_DIR}/api_cache.sqlite"
+STATE_PATH = f"{OUT_DIR}/sync_state.json"
+FAILED_CSV = f"{OUT_DIR}/failed.csv"
+SHARDS_DIR = f"{OUT_DIR}/shards"
+JOURNAL_PATH = f"{OUT_DIR}/journal.jsonl"
 MAX_WORKERS = 8
 MAX_RETRIES = 8
+CRAWL_WORKERS = 8
+API_RATE_LIMIT = 10.0
+DOWNLOAD_RATE_LIMIT = None
+CACHE_TTL = 7 * 24 * 3600
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_OFFLINE = False
 IMAGEINFO_BATCH_SIZE = 50
 DOWNLOAD_QUEUE_LIMIT = 600
+PIPELINE_REPORT_INTERVAL = 15.0
+PHASH_KIND = "phash"
+PHASH_RADIUS = 6
+SHARD_BYTES = 256 * 1024 * 1024
 MIN_WIDTH = None
 MIN_HEIGHT = None
 MAX_IMAGES_PER_CLASS = 2000
@@ -1,11 +1,32 @@
+import argparse
+
 import config
 from stardew.types import GroupSpec
+from stardew.blob_store import BlobStore
+from stardew.http_pool import HttpPool
+from stardew.rate_limit import AdaptiveLimiter
+from stardew.response_cache import ResponseCache
+from stardew.shards import ShardWriter
 from stardew.stardew_wiki_api import WikiAPI
 from stardew.dataset_builder import build_dataset
 
 
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--incremental", action="store_true",
+                    help="only fetch files uploaded or changed since the last sync watermark")
+    ap.add_argument("--resume", action="store_true",
+                    help="replay the build journal left by an interrupted run instead of starting over")
+    return ap.parse_args()
+
+
 def main():
-    api = WikiAPI(config.API_URL, config.USER_AGENT, max_retries=config.MAX_RETRIES)
+    args = parse_args()
+    pool = HttpPool(config.USER_AGENT, pool_size=config.MAX_WORKERS + config.CRAWL_WORKERS)
+    cache = ResponseCache(config.CACHE_PATH, ttl=config.CACHE_TTL, max_bytes=config.CACHE_MAX_BYTES,
+                          offline=config.CACHE_OFFLINE)
+    api = WikiAPI(config.API_URL, config.USER_AGENT, max_retries=config.MAX_RETRIES, pool=pool, cache=cache,
+                  limiter=AdaptiveLimiter(rate=config.API_RATE_LIMIT, max_concurrency=config.CRAWL_WORKERS))
 
     groups = []
     for g in config.GROUPS:
@@ -24,11 +45,23 @@ def main():
         out_dir=config.OUT_DIR,
         images_root=config.IMAGES_ROOT,
         meta_csv=config.META_CSV,
-        user_agent=config.USER_AGENT,
         max_workers=config.MAX_WORKERS,
         batch_size=config.IMAGEINFO_BATCH_SIZE,
         queue_limit=config.DOWNLOAD_QUEUE_LIMIT,
         max_retries=config.MAX_RETRIES,
+        crawl_workers=config.CRAWL_WORKERS,
+        state_path=config.STATE_PATH,
+        incremental=args.incremental,
+        report_interval=config.PIPELINE_REPORT_INTERVAL,
+        failed_csv=config.FAILED_CSV,
+        store=BlobStore(config.BLOBS_DIR),
+        phash_kind=config.PHASH_KIND,
+        phash_radius=config.PHASH_RADIUS,
+        shards=ShardWriter(config.SHARDS_DIR, shard_bytes=config.SHARD_BYTES,
+                           classes=[g["group"] for g in config.GROUPS]) if config.SHARDS_DIR else None,
+        journal_path=config.JOURNAL_PATH,
+        resume=args.resume,
+        limiter=AdaptiveLimiter(rate=config.DOWNLOAD_RATE_LIMIT, max_concurrency=config.MAX_WORKERS),
     )
 
 
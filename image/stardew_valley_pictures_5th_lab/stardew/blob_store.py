@@ -0,0 +1,116 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self.index_hits = 0
+        self.stored = 0
+        self.dedup_hits = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " url TEXT PRIMARY KEY,"
+            " digest TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def lookup(self, url: str, size: Optional[int] = None) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT digest, size FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        digest, stored_size = row
+        if size is not None and int(size) != stored_size:
+            return None
+        if not os.path.exists(self.blob_path(digest)):
+            return None
+        with self._lock:
+            self.index_hits += 1
+        return digest
+
+    def put(self, url: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+
+        if os.path.exists(path):
+            with self._lock:
+                self.dedup_hits += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = os.path.join(self.tmp_dir, f"{digest}.{threading.get_ident()}.part")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                self.stored += 1
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)", (url, digest, len(data), time.time())
+            )
+        return digest
+
+    def adopt_file(self, url: str, src_path: str) -> str:
+        h = hashlib.sha256()
+        size = 0
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+                size += len(chunk)
+        digest = h.hexdigest()
+        path = self.blob_path(digest)
+
+        if os.path.exists(path):
+            os.remove(src_path)
+            with self._lock:
+                self.dedup_hits += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(src_path, path)
+            with self._lock:
+                self.stored += 1
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)", (url, digest, size, time.time()))
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        with open(self.blob_path(digest), "rb") as f:
+            return f.read()
+
+    def materialize(self, digest: str, dst_path: str) -> str:
+        if os.path.exists(dst_path):
+            return dst_path
+        src = self.blob_path(digest)
+        tmp = f"{dst_path}.{threading.get_ident()}.part"
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst_path)
+        return dst_path
+
+    def stats(self) -> Dict[str, int]:
+        return {"index_hits": self.index_hits, "stored": self.stored, "dedup_hits": self.dedup_hits}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
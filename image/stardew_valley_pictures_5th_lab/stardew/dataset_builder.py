@@ -1,39 +1,69 @@
 import os
 import csv
-from typing import Dict, List, Tuple, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from typing import Dict, List, Optional, Tuple, Set
+from concurrent.futures import ThreadPoolExecutor
 
 from .types import GroupSpec
 from .utils import ensure_dirs, sha1, guess_ext
-from .downloader import download_with_retries
+from .http_pool import HttpPool
+from .sync_state import SyncDelta, load_watermark, read_metadata, save_watermark, utc_now_iso
+from .blob_store import BlobStore
+from .downloader import download_to_store
+from .journal import Journal
+from .pipeline import Channel, Pipeline, Timings
+from .rate_limit import AdaptiveLimiter
+from .phash import annotate_metadata
+from .shards import ShardWriter
 from .stardew_wiki_api import WikiAPI
 
-META_FIELDS = ["group", "image_path", "source_category", "file_title", "url", "mime", "width", "height", "bytes"]
+META_FIELDS = [
+    "group", "image_path", "source_category", "file_title", "url", "mime", "width", "height", "bytes",
+    "phash", "dup_cluster",
+]
+FAILED_FIELDS = META_FIELDS + ["error"]
 
 
-def collect_file_titles(api: WikiAPI, spec: GroupSpec) -> List[Tuple[str, str]]:
-    seen: Set[str] = set()
-    queue: List[Tuple[str, int]] = [(c, 0) for c in spec.roots]
-    out: List[Tuple[str, str]] = []
-
-    while queue:
-        cat, depth = queue.pop(0)
-        if cat in seen:
-            continue
-        seen.add(cat)
+def _list_members(api: WikiAPI, cat: str) -> List[Dict]:
+    return list(api.iter_category_members(cat))
 
-        for item in api.iter_category_members(cat):
-            ns = item.get("ns")
-            title = item.get("title", "")
 
-            if ns == 14 and depth < spec.max_depth:
-                queue.append((title, depth + 1))
-                continue
+def collect_file_titles(api: WikiAPI, spec: GroupSpec, workers: int = 1) -> List[Tuple[str, str]]:
+    seen: Set[str] = set()
+    level: List[str] = list(spec.roots)
+    depth = 0
+    out: List[Tuple[str, str]] = []
 
-            if ns == 6 and title.startswith("File:"):
-                out.append((cat, title))
-                if spec.max_images is not None and len(out) >= spec.max_images:
-                    return out
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while level:
+            cats: List[str] = []
+            for cat in level:
+                if cat not in seen:
+                    seen.add(cat)
+                    cats.append(cat)
+
+            futs = [ex.submit(_list_members, api, cat) for cat in cats]
+            next_level: List[str] = []
+            try:
+                for cat, fut in zip(cats, futs):
+                    for item in fut.result():
+                        ns = item.get("ns")
+                        title = item.get("title", "")
+
+                        if ns == 14 and depth < spec.max_depth:
+                            next_level.append(title)
+                            continue
+
+                        if ns == 6 and title.startswith("File:"):
+                            out.append((cat, title))
+                            if spec.max_images is not None and len(out) >= spec.max_images:
+                                return out
+            finally:
+                for fut in futs:
+                    fut.cancel()
+
+            level = next_level
+            depth += 1
 
     return out
 
@@ -49,105 +79,172 @@ def pass_size_filter(spec: GroupSpec, info: Dict) -> bool:
 
 
 def write_row(writer: csv.DictWriter, row: Dict) -> None:
+    if row.get("image_path"):
+        row["image_path"] = row["image_path"].replace(os.sep, "/")
     writer.writerow(row)
 
 
-def flush_futures(writer: csv.DictWriter, future_map: Dict) -> int:
-    wrote = 0
-    for fut in as_completed(list(future_map.keys())):
-        row = future_map.pop(fut)
-        row["image_path"] = fut.result()
-        write_row(writer, row)
-        wrote += 1
-    return wrote
+def write_sample(shards: ShardWriter, row: Dict) -> None:
+    with open(row["image_path"], "rb") as f:
+        image = f.read()
+    meta = {k: row.get(k) for k in META_FIELDS if k not in ("phash", "dup_cluster")}
+    shards.write(image, os.path.splitext(row["image_path"])[1], row["group"], meta)
 
 
-def schedule_one_download(
-    ex: ThreadPoolExecutor,
-    future_map: Dict,
-    row: Dict,
-    url: str,
-    img_path: str,
-    user_agent: str,
-    max_retries: int,
+def discover_stage(
+    api: WikiAPI,
+    groups: List[GroupSpec],
+    images_root: str,
+    crawl_workers: int,
+    delta: Optional[SyncDelta],
+    journal: Journal,
+    titles: Channel,
+    rows: Channel,
 ) -> None:
-    fut = ex.submit(download_with_retries, url, img_path, user_agent, max_retries)
-    future_map[fut] = row
-
-
-def build_group(
+    global_seen_files: Set[str] = set()
+    try:
+        for spec in groups:
+            ensure_dirs(os.path.join(images_root, spec.group))
+
+            candidates = journal.state.titles.get(spec.group)
+            if candidates is None:
+                candidates = collect_file_titles(api, spec, workers=crawl_workers)
+                journal.titles(spec.group, candidates)
+            if delta is not None:
+                # new uploads go first so a full max_images cap drops older files, not the new ones;
+                # build a new list, the journal's copy must stay as recorded
+                candidates = [*delta.extra_members(spec.roots, candidates), *candidates]
+                if spec.max_images is not None:
+                    candidates = candidates[:spec.max_images]
+
+            filtered: List[Tuple[str, str]] = []
+            for cat, ft in candidates:
+                if ft in global_seen_files:
+                    continue
+                global_seen_files.add(ft)
+                filtered.append((cat, ft))
+
+            print(f"== {spec.group} | files: {len(filtered)} ==")
+
+            for cat, ft in filtered:
+                known = journal.state.done_row(ft)
+                if known is None and delta is not None:
+                    known = delta.reusable_row(ft)
+                if known is not None:
+                    ok = rows.put(dict(known, group=spec.group, source_category=cat))
+                else:
+                    ok = titles.put((spec, cat, ft))
+                if not ok:
+                    return
+    finally:
+        titles.close()
+        rows.close()
+
+
+def imageinfo_stage(
     api: WikiAPI,
-    ex: ThreadPoolExecutor,
-    writer: csv.DictWriter,
-    future_map: Dict,
-    spec: GroupSpec,
+    store: BlobStore,
     images_root: str,
-    global_seen_files: Set[str],
     batch_size: int,
-    queue_limit: int,
-    user_agent: str,
+    delta: Optional[SyncDelta],
+    journal: Journal,
+    titles: Channel,
+    downloads: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        for chunk in titles.batches(batch_size):
+            lookup = [ft for _, _, ft in chunk if delta is None or ft not in delta.changed]
+            infos = {ft: journal.state.infos[ft] for ft in lookup if ft in journal.state.infos}
+            lookup = [ft for ft in lookup if ft not in infos]
+            if lookup:
+                fetched = api.imageinfo_batch(lookup, batch_size=batch_size)
+                journal.infos(fetched)
+                infos.update(fetched)
+            if delta is not None:
+                infos.update({ft: delta.changed[ft] for _, _, ft in chunk if ft in delta.changed})
+
+            for spec, cat, ft in chunk:
+                info = infos.get(ft)
+                if not info:
+                    continue
+                if not pass_size_filter(spec, info):
+                    continue
+
+                url = info.get("url")
+                if not url:
+                    continue
+
+                mime = info.get("mime")
+                ext = guess_ext(url, mime)
+                group_dir = os.path.join(images_root, spec.group)
+
+                row = {
+                    "group": spec.group,
+                    "image_path": "",
+                    "source_category": cat,
+                    "file_title": ft,
+                    "url": url,
+                    "mime": mime,
+                    "width": info.get("width"),
+                    "height": info.get("height"),
+                    "bytes": info.get("size"),
+                }
+
+                digest = None
+                if delta is None or ft not in delta.changed:
+                    digest = store.lookup(url, info.get("size"))
+                    legacy_path = os.path.join(group_dir, f"{sha1(url)}{ext}")
+                    if digest is None and os.path.exists(legacy_path):
+                        digest = store.adopt_file(url, legacy_path)
+
+                if digest is not None:
+                    row["image_path"] = store.materialize(digest, os.path.join(group_dir, f"{digest}{ext}"))
+                    ok = rows.put(row)
+                else:
+                    ok = downloads.put((row, url, group_dir, ext))
+                if not ok:
+                    return
+    finally:
+        downloads.close()
+        rows.close()
+
+
+def download_stage(
+    pool: HttpPool,
+    store: BlobStore,
+    limiter: AdaptiveLimiter,
     max_retries: int,
-) -> int:
-    group_dir = os.path.join(images_root, spec.group)
-    ensure_dirs(group_dir)
-
-    candidates = collect_file_titles(api, spec)
-
-    filtered: List[Tuple[str, str]] = []
-    for cat, ft in candidates:
-        if ft in global_seen_files:
-            continue
-        global_seen_files.add(ft)
-        filtered.append((cat, ft))
-
-    print(f"== {spec.group} | files: {len(filtered)} ==")
-
-    total = 0
-    for i in range(0, len(filtered), batch_size):
-        chunk = filtered[i:i + batch_size]
-        titles = [ft for _, ft in chunk]
-        infos = api.imageinfo_batch(titles, batch_size=batch_size)
-
-        for cat, ft in chunk:
-            info = infos.get(ft)
-            if not info:
-                continue
-            if not pass_size_filter(spec, info):
-                continue
-
-            url = info.get("url")
-            if not url:
-                continue
-
-            mime = info.get("mime")
-            ext = guess_ext(url, mime)
-            img_path = os.path.join(group_dir, f"{sha1(url)}{ext}")
-
-            row = {
-                "group": spec.group,
-                "image_path": "",
-                "source_category": cat,
-                "file_title": ft,
-                "url": url,
-                "mime": mime,
-                "width": info.get("width"),
-                "height": info.get("height"),
-                "bytes": info.get("size"),
-            }
-
-            if os.path.exists(img_path):
-                row["image_path"] = img_path
-                write_row(writer, row)
-                total += 1
-            else:
-                schedule_one_download(ex, future_map, row, url, img_path, user_agent, max_retries)
-
-            if len(future_map) >= queue_limit:
-                total += flush_futures(writer, future_map)
-
-    total += flush_futures(writer, future_map)
-    print(f"[{spec.group}] done. rows written: {total}")
-    return total
+    timings: Timings,
+    downloads: Channel,
+    rows: Channel,
+) -> None:
+    try:
+        for row, url, group_dir, ext in downloads:
+            t0 = time.monotonic()
+            try:
+                digest = download_to_store(url, store, pool, max_retries, limiter)
+                row["image_path"] = store.materialize(digest, os.path.join(group_dir, f"{digest}{ext}"))
+            except RuntimeError as e:
+                row["error"] = str(e)
+            timings.record(time.monotonic() - t0)
+            if not rows.put(row):
+                return
+    finally:
+        rows.close()
+
+
+def load_delta(api: WikiAPI, meta_csv: str, state_path: str, batch_size: int) -> Optional[SyncDelta]:
+    watermark = load_watermark(state_path)
+    known = read_metadata(meta_csv)
+    if watermark is None or not known:
+        print("Incremental: no previous sync, running a full build")
+        return None
+
+    changed = {item["title"]: item for item in api.iter_changed_files(watermark) if item.get("title")}
+    categories = api.categories_batch(list(changed), batch_size=batch_size) if changed else {}
+    print(f"Incremental: {len(changed)} files changed since {watermark}")
+    return SyncDelta(known=known, changed=changed, categories=categories)
 
 
 def build_dataset(
@@ -156,40 +253,103 @@ def build_dataset(
     out_dir: str,
     images_root: str,
     meta_csv: str,
-    user_agent: str,
     max_workers: int,
     batch_size: int,
     queue_limit: int,
     max_retries: int,
+    crawl_workers: int = 1,
+    state_path: Optional[str] = None,
+    incremental: bool = False,
+    report_interval: Optional[float] = None,
+    failed_csv: Optional[str] = None,
+    store: Optional[BlobStore] = None,
+    phash_kind: Optional[str] = "phash",
+    phash_radius: int = 6,
+    shards: Optional[ShardWriter] = None,
+    journal_path: Optional[str] = None,
+    resume: bool = False,
+    limiter: Optional[AdaptiveLimiter] = None,
 ) -> None:
     ensure_dirs(out_dir, images_root)
-
-    global_seen_files: Set[str] = set()
-    total_rows = 0
-
-    with open(meta_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=META_FIELDS)
-        writer.writeheader()
-
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            future_map: Dict = {}
-
-            for spec in groups:
-                total_rows += build_group(
-                    api=api,
-                    ex=ex,
-                    writer=writer,
-                    future_map=future_map,
-                    spec=spec,
-                    images_root=images_root,
-                    global_seen_files=global_seen_files,
-                    batch_size=batch_size,
-                    queue_limit=queue_limit,
-                    user_agent=user_agent,
-                    max_retries=max_retries,
-                )
+    limiter = limiter or AdaptiveLimiter(max_concurrency=max_workers)
+    failed_csv = failed_csv or os.path.join(out_dir, "failed.csv")
+    store = store or BlobStore(os.path.join(out_dir, "blobs"))
+    journal = Journal(journal_path or os.path.join(out_dir, "journal.jsonl"), resume=resume)
+    if resume:
+        print(f"Resume: {len(journal.state.titles)} groups discovered, {len(journal.state.infos)} imageinfos, "
+              f"{len(journal.state.rows)} rows done")
+
+    started = utc_now_iso()
+    delta = load_delta(api, meta_csv, state_path, batch_size) if incremental and state_path else None
+
+    pipe = Pipeline()
+    titles = pipe.channel("titles", maxsize=batch_size * 4)
+    downloads = pipe.channel("downloads", maxsize=queue_limit)
+    rows = pipe.channel("rows", maxsize=queue_limit, producers=2 + max_workers)
+
+    pipe.spawn("discover", discover_stage, api, groups, images_root, crawl_workers, delta, journal, titles, rows)
+    pipe.spawn("imageinfo", imageinfo_stage, api, store, images_root, batch_size, delta, journal,
+               titles, downloads, rows)
+    timings = Timings()
+    for i in range(max_workers):
+        pipe.spawn(f"download-{i}", download_stage, api.pool, store, limiter, max_retries, timings,
+                   downloads, rows)
+    pipe.monitor(report_interval)
+
+    per_group: Dict[str, int] = {spec.group: 0 for spec in groups}
+    failed = 0
+    tmp_csv = meta_csv + ".part"
+    try:
+        with open(tmp_csv, "w", newline="", encoding="utf-8") as f, \
+                open(failed_csv, "w", newline="", encoding="utf-8") as ff:
+            writer = csv.DictWriter(f, fieldnames=META_FIELDS)
+            writer.writeheader()
+            failed_writer = csv.DictWriter(ff, fieldnames=FAILED_FIELDS)
+            failed_writer.writeheader()
+
+            for row in rows:
+                if row.get("error"):
+                    write_row(failed_writer, row)
+                    failed += 1
+                    continue
+                write_row(writer, row)
+                journal.row(row)
+                if shards is not None:
+                    write_sample(shards, row)
+                per_group[row["group"]] += 1
+        pipe.join()
+    except BaseException:
+        pipe.stop.set()
+        journal.close()
+        if shards is not None:
+            shards.abort()
+        raise
+
+    shard_stats = shards.close() if shards is not None else None
+    os.replace(tmp_csv, meta_csv)
+    if phash_kind:
+        print("Near-duplicates:", annotate_metadata(meta_csv, kind=phash_kind, radius=phash_radius))
+    if state_path:
+        save_watermark(state_path, started)
+    journal.finish()
+
+    for group, n in per_group.items():
+        print(f"[{group}] done. rows written: {n}")
 
     print("DONE")
     print("Images root:", images_root)
     print("Metadata:", meta_csv)
-    print("Rows:", total_rows)
\ No newline at end of file
+    print("Rows:", sum(per_group.values()))
+    print("Failed:", failed)
+    if failed:
+        print("Failures:", failed_csv)
+    print("Download latency:", timings.summary())
+    print("HTTP:", api.pool.stats())
+    print("API limiter:", api.limiter.stats())
+    print("Download limiter:", limiter.stats())
+    print("Blob store:", store.stats())
+    if api.cache is not None:
+        print("API cache:", api.cache.stats())
+    if shard_stats is not None:
+        print("Shards:", shards.out_dir, shard_stats)
+    print("Pipeline:", pipe.metrics())
@@ -1,42 +1,57 @@
-import os
 import time
 from typing import Optional
 
 import requests
 
+from .blob_store import BlobStore
+from .http_pool import HttpPool
+from .rate_limit import THROTTLE_STATUS, AdaptiveLimiter, parse_retry_after
 
 RETRYABLE_STATUS = {429, 502, 503, 504}
 
 
-def download_with_retries(url: str, out_path: str, user_agent: str, max_retries: int = 8) -> str:
+def fetch_with_retries(url: str, pool: HttpPool, max_retries: int = 8,
+                       limiter: Optional[AdaptiveLimiter] = None) -> bytes:
+    limiter = limiter or AdaptiveLimiter()
     last_err: Optional[Exception] = None
 
     for attempt in range(max_retries):
-        try:
-            s = requests.Session()
-            s.headers.update({"User-Agent": user_agent, "Connection": "close"})
-            with s.get(url, stream=True, timeout=60) as r:
-                if r.status_code in RETRYABLE_STATUS:
-                    time.sleep(min(20.0, 2 ** attempt))
-                    continue
-                r.raise_for_status()
-
-                tmp = out_path + ".part"
-                with open(tmp, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024 * 128):
-                        if chunk:
-                            f.write(chunk)
-
-                os.replace(tmp, out_path)
-                return out_path
-
-        except (requests.exceptions.SSLError,
-                requests.exceptions.ConnectionError,
-                requests.exceptions.Timeout) as e:
-            last_err = e
-            time.sleep(min(20.0, 2 ** attempt))
-        except Exception as e:
-            last_err = e
-            time.sleep(min(10.0, 2 ** attempt))
+        delay = 0.0
+        with limiter.slot():
+            t0 = time.monotonic()
+            try:
+                with pool.get(url, stream=True, timeout=60) as r:
+                    if r.status_code in THROTTLE_STATUS:
+                        retry_after = parse_retry_after(r.headers)
+                        last_err = RuntimeError(f"HTTP {r.status_code} (Retry-After: {retry_after})")
+                        limiter.throttled(attempt, retry_after, started=t0)
+                        continue
+                    if r.status_code in RETRYABLE_STATUS:
+                        last_err = RuntimeError(f"HTTP {r.status_code}")
+                        delay = limiter.failed(attempt, started=t0)
+                    else:
+                        r.raise_for_status()
+
+                        buf = bytearray()
+                        for chunk in r.iter_content(chunk_size=1024 * 128):
+                            if chunk:
+                                buf += chunk
+                        limiter.success(time.monotonic() - t0)
+                        return bytes(buf)
+
+            except (requests.exceptions.SSLError,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                last_err = e
+                delay = limiter.failed(attempt, started=t0)
+            except Exception as e:
+                last_err = e
+                delay = limiter.backoff(attempt)
+        time.sleep(delay)
 
     raise RuntimeError(f"Download failed after retries: {last_err}")
+
+
+def download_to_store(url: str, store: BlobStore, pool: HttpPool, max_retries: int = 8,
+                      limiter: Optional[AdaptiveLimiter] = None) -> str:
+    return store.put(url, fetch_with_retries(url, pool, max_retries, limiter))
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class JournalState:
+    titles: Dict[str, List[Tuple[str, str]]] = field(default_factory=dict)
+    infos: Dict[str, Dict] = field(default_factory=dict)
+    rows: Dict[str, Dict] = field(default_factory=dict)
+
+    def done_row(self, ft: str) -> Optional[Dict]:
+        row = self.rows.get(ft)
+        if row is None or not row.get("image_path") or not os.path.exists(row["image_path"]):
+            return None
+        return row
+
+
+def load_journal(path: str) -> JournalState:
+    state = JournalState()
+    if not os.path.exists(path):
+        return state
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            kind = rec.get("kind")
+            if kind == "titles":
+                state.titles[rec["scope"]] = [tuple(x) for x in rec["items"]]
+            elif kind == "info":
+                state.infos.update(rec["items"])
+            elif kind == "row":
+                state.rows[rec["row"]["file_title"]] = rec["row"]
+    return state
+
+
+class Journal:
+    def __init__(self, path: str, resume: bool = False, sync_every: int = 64):
+        self.path = path
+        self.sync_every = sync_every
+        self.state = load_journal(path) if resume else JournalState()
+        self._lock = threading.Lock()
+        self._pending = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume:
+            self._truncate_partial_tail()
+
+    def _truncate_partial_tail(self) -> None:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            self._f.truncate(end)
+
+    def _append(self, rec: Dict, sync: bool = False) -> None:
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            self._pending += 1
+            if sync or self._pending >= self.sync_every:
+                os.fsync(self._f.fileno())
+                self._pending = 0
+
+    def titles(self, scope: str, items: List[Tuple[str, str]]) -> None:
+        self._append({"kind": "titles", "scope": scope, "items": [list(x) for x in items]}, sync=True)
+
+    def infos(self, items: Dict[str, Dict]) -> None:
+        if items:
+            self._append({"kind": "info", "items": items})
+
+    def row(self, row: Dict) -> None:
+        self._append({"kind": "row", "row": row})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+
+    def finish(self) -> None:
+        self.close()
+        os.remove(self.path)
@@ -0,0 +1,211 @@
+import csv
+import itertools
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZES = {
+    "ahash": (8, 8),
+    "dhash": (9, 8),
+    "phash": (32, 32),
+}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def load_gray(path: str, size: Tuple[int, int]) -> Optional[np.ndarray]:
+    try:
+        with Image.open(path) as im:
+            if getattr(im, "is_animated", False):
+                im.seek(0)
+            im = im.convert("RGBA")
+            bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
+            bg.alpha_composite(im)
+            gray = bg.convert("L").resize(size, Image.Resampling.LANCZOS)
+            return np.asarray(gray, dtype=np.float32)
+    except Exception:
+        return None
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    packed = np.packbits(bits.reshape(len(bits), 64).astype(np.uint8), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+def ahash(x: np.ndarray) -> np.ndarray:
+    return _pack(x > x.mean(axis=(1, 2), keepdims=True))
+
+
+def dhash(x: np.ndarray) -> np.ndarray:
+    return _pack(x[:, :, 1:] > x[:, :, :-1])
+
+
+def phash(x: np.ndarray) -> np.ndarray:
+    low = (_DCT32 @ x @ _DCT32.T)[:, :8, :8]
+    med = np.median(low.reshape(len(low), 64), axis=1)
+    return _pack(low > med[:, None, None])
+
+
+HASHERS = {"ahash": ahash, "dhash": dhash, "phash": phash}
+
+
+def hash_images(paths: Sequence[str], kind: str = "phash", batch_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    size = HASH_SIZES[kind]
+    fn = HASHERS[kind]
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    ok = np.zeros(len(paths), dtype=bool)
+
+    for start in range(0, len(paths), batch_size):
+        arrays = []
+        idx = []
+        for i in range(start, min(start + batch_size, len(paths))):
+            a = load_gray(paths[i], size)
+            if a is not None:
+                arrays.append(a)
+                idx.append(i)
+        if arrays:
+            hashes[idx] = fn(np.stack(arrays))
+            ok[idx] = True
+    return hashes, ok
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return np.unpackbits(x.view(np.uint8).reshape(len(x), 8), axis=1).sum(axis=1)
+
+
+def _probe_masks(bits: int, radius: int) -> np.ndarray:
+    masks = [0]
+    for r in range(1, radius + 1):
+        for combo in itertools.combinations(range(bits), r):
+            m = 0
+            for b in combo:
+                m |= 1 << b
+            masks.append(m)
+    return np.array(masks, dtype=np.uint64)
+
+
+class HashIndex:
+    def __init__(self, hashes: np.ndarray, chunks: int = 4):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.chunks = chunks
+        self.chunk_bits = 64 // chunks
+        self._mask = np.uint64((1 << self.chunk_bits) - 1)
+        self._keys: List[np.ndarray] = []
+        self._order: List[np.ndarray] = []
+        for c in range(chunks):
+            keys = self._chunk(self.hashes, c)
+            order = np.argsort(keys, kind="stable")
+            self._keys.append(keys[order])
+            self._order.append(order)
+
+    def _chunk(self, hashes: np.ndarray, c: int) -> np.ndarray:
+        return (hashes >> np.uint64(c * self.chunk_bits)) & self._mask
+
+    def near_pairs(self, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self.hashes)
+        if n < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        masks = _probe_masks(self.chunk_bits, radius // self.chunks)
+        found = []
+        for c in range(self.chunks):
+            q = self._chunk(self.hashes, c)
+            for m in masks:
+                probe = q ^ m
+                lo = np.searchsorted(self._keys[c], probe, side="left")
+                hi = np.searchsorted(self._keys[c], probe, side="right")
+                counts = hi - lo
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                src = np.repeat(np.arange(n), counts)
+                offs = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                dst = self._order[c][np.repeat(lo, counts) + offs]
+                keep = src < dst
+                found.append(src[keep].astype(np.int64) * n + dst[keep])
+
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        pairs = np.unique(np.concatenate(found))
+        i, j = pairs // n, pairs % n
+        close = popcount(self.hashes[i] ^ self.hashes[j]) <= radius
+        return i[close], j[close]
+
+    def clusters(self, radius: int) -> np.ndarray:
+        parent = np.arange(len(self.hashes))
+
+        def find(a: int) -> int:
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            return a
+
+        for a, b in zip(*self.near_pairs(radius)):
+            ra, rb = find(int(a)), find(int(b))
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        roots = np.array([find(a) for a in range(len(parent))], dtype=np.int64)
+        _, labels = np.unique(roots, return_inverse=True)
+        return labels
+
+
+def annotate_metadata(meta_csv: str, kind: str = "phash", radius: int = 6) -> Dict[str, int]:
+    with open(meta_csv, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames or [])
+        rows = list(reader)
+
+    paths: List[str] = []
+    slot: Dict[str, int] = {}
+    for row in rows:
+        p = row.get("image_path") or ""
+        if p and p not in slot and os.path.exists(p):
+            slot[p] = len(paths)
+            paths.append(p)
+
+    hashes, ok = hash_images(paths, kind=kind)
+    valid = np.flatnonzero(ok)
+    labels = np.full(len(paths), -1, dtype=np.int64)
+    labels[valid] = HashIndex(hashes[valid]).clusters(radius)
+
+    for row in rows:
+        k = slot.get(row.get("image_path") or "")
+        if k is None or not ok[k]:
+            row["phash"] = ""
+            row["dup_cluster"] = ""
+        else:
+            row["phash"] = f"{int(hashes[k]):016x}"
+            row["dup_cluster"] = int(labels[k])
+
+    for name in ("phash", "dup_cluster"):
+        if name not in fieldnames:
+            fieldnames.append(name)
+
+    tmp = meta_csv + ".part"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, meta_csv)
+
+    sizes = np.bincount(labels[valid]) if len(valid) else np.empty(0, dtype=np.int64)
+    return {
+        "hashed": int(len(valid)),
+        "clusters": int(len(sizes)),
+        "dup_clusters": int((sizes > 1).sum()),
+        "dup_images": int(sizes[sizes > 1].sum()),
+    }
@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Mapping, Optional
+
+THROTTLE_STATUS = {429, 503}
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float], burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._paused_until)
+            if self.rate:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1.0
+                if self._tokens < 0:
+                    at = max(at, now - self._tokens / self.rate)
+        if at > now:
+            time.sleep(at - now)
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: float = 1.0,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        latency_factor: Optional[float] = 4.0,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20.0,
+        cooldown: float = 1.0,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.latency_factor = latency_factor
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cooldown = cooldown
+
+        self._cond = threading.Condition()
+        self._limit = float(self.max_concurrency)
+        self._active = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._counts = {"requests": 0, "throttled": 0, "errors": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+        try:
+            self.bucket.wait()
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def _decrease(self, factor: float, started: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        # a request sent before the last decrease belongs to the congestion already acted on
+        if started is not None and started < self._last_decrease:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_concurrency), self._limit * factor)
+        self._counts["decreases"] += 1
+
+    def success(self, latency: float) -> None:
+        with self._cond:
+            self._counts["requests"] += 1
+            if self._baseline is None:
+                self._baseline = latency
+            slow = self.latency_factor and latency > self._baseline * self.latency_factor
+            self._baseline = 0.9 * self._baseline + 0.1 * latency
+            if slow:
+                self._decrease(0.9, started=time.monotonic() - latency)
+            else:
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(1.0, self._limit))
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0.0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def throttled(self, attempt: int, retry_after: Optional[float] = None, started: Optional[float] = None) -> float:
+        delay = self.backoff(attempt) if retry_after is None else retry_after + random.uniform(0.0, 1.0)
+        self.bucket.pause(delay)
+        with self._cond:
+            self._counts["throttled"] += 1
+            self._decrease(0.5, started)
+        return delay
+
+    def failed(self, attempt: int, started: Optional[float] = None) -> float:
+        with self._cond:
+            self._counts["errors"] += 1
+            self._decrease(0.5, started)
+        return self.backoff(attempt)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return dict(self._counts, concurrency=self.limit,
+                        latency=round(self._baseline, 3) if self._baseline is not None else None)
@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+import os
+import random
+import tarfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+INDEX_FIELDS = ["key", "shard", "label", "group", "ext", "offset", "size"]
+
+
+class ShardWriter:
+    def __init__(
+        self,
+        out_dir: str,
+        shard_bytes: int = 256 * 1024 * 1024,
+        prefix: str = "shard",
+        classes: Optional[List[str]] = None,
+    ):
+        self.out_dir = out_dir
+        self.shard_bytes = shard_bytes
+        self.prefix = prefix
+        self.labels: Dict[str, int] = {c: i for i, c in enumerate(classes or [])}
+        self.index: List[Dict] = []
+        self.shards: List[str] = []
+        self._tar: Optional[tarfile.TarFile] = None
+        self._tmp: Optional[str] = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open_shard(self) -> None:
+        name = f"{self.prefix}-{len(self.shards):05d}.tar"
+        self.shards.append(name)
+        self._tmp = os.path.join(self.out_dir, name + ".part")
+        self._tar = tarfile.open(self._tmp, "w", format=tarfile.USTAR_FORMAT)
+
+    def _close_shard(self) -> None:
+        if self._tar is None:
+            return
+        self._tar.close()
+        os.replace(self._tmp, os.path.join(self.out_dir, self.shards[-1]))
+        self._tar = None
+        self._tmp = None
+
+    def _add(self, name: str, data: bytes, mtime: float) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        header = info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        info.offset_data = self._tar.offset + len(header)
+        self._tar.addfile(info, io.BytesIO(data))
+        return info
+
+    def write(self, image: bytes, ext: str, group: str, meta: Dict) -> str:
+        if self._tar is None or self._tar.offset >= self.shard_bytes:
+            self._close_shard()
+            self._open_shard()
+
+        label = self.labels.setdefault(group, len(self.labels))
+        key = f"{len(self.index):09d}"
+        ext = ext.lstrip(".")
+        now = time.time()
+        info = self._add(f"{key}.{ext}", image, now)
+        self._add(f"{key}.cls", str(label).encode("ascii"), now)
+        self._add(f"{key}.json", json.dumps(meta, ensure_ascii=False).encode("utf-8"), now)
+
+        self.index.append({
+            "key": key,
+            "shard": self.shards[-1],
+            "label": label,
+            "group": group,
+            "ext": ext,
+            "offset": info.offset_data,
+            "size": info.size,
+        })
+        return key
+
+    def close(self) -> Dict:
+        self._close_shard()
+        keep = set(self.shards)
+        for name in os.listdir(self.out_dir):
+            if name.startswith(self.prefix + "-") and name.endswith(".tar") and name not in keep:
+                os.remove(os.path.join(self.out_dir, name))
+
+        tmp = os.path.join(self.out_dir, "index.csv.part")
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.index)
+        os.replace(tmp, os.path.join(self.out_dir, "index.csv"))
+
+        tmp = os.path.join(self.out_dir, "classes.json.part")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.labels, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.out_dir, "classes.json"))
+
+        return {"samples": len(self.index), "shards": len(self.shards)}
+
+    def abort(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            os.remove(self._tmp)
+            self._tar = None
+            self._tmp = None
+
+
+def list_shards(out_dir: str, prefix: str = "shard") -> List[str]:
+    return sorted(
+        os.path.join(out_dir, name) for name in os.listdir(out_dir)
+        if name.startswith(prefix + "-") and name.endswith(".tar")
+    )
+
+
+def _iter_tar(path: str) -> Iterator[Dict]:
+    sample: Dict = {}
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, _, ext = member.name.partition(".")
+            if sample and sample["__key__"] != key:
+                yield sample
+                sample = {}
+            sample["__key__"] = key
+            sample[ext] = tar.extractfile(member).read()
+    if sample:
+        yield sample
+
+
+def _decode(sample: Dict) -> Dict:
+    out = {"key": sample.pop("__key__")}
+    out["label"] = int(sample.pop("cls"))
+    out["meta"] = json.loads(sample.pop("json"))
+    (out["ext"], out["image"]), = sample.items()
+    return out
+
+
+def iter_samples(
+    out_dir: str,
+    shuffle_buffer: int = 0,
+    seed: Optional[int] = None,
+    prefix: str = "shard",
+) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    shards = list_shards(out_dir, prefix)
+    if shuffle_buffer:
+        rng.shuffle(shards)
+
+    buf: List[Dict] = []
+    for path in shards:
+        for sample in _iter_tar(path):
+            sample = _decode(sample)
+            if not shuffle_buffer:
+                yield sample
+                continue
+            if len(buf) < shuffle_buffer:
+                buf.append(sample)
+                continue
+            i = rng.randrange(len(buf))
+            yield buf[i]
+            buf[i] = sample
+
+    rng.shuffle(buf)
+    yield from buf
+
+
+def load_index(out_dir: str) -> List[Dict]:
+    with open(os.path.join(out_dir, "index.csv"), newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def read_image(out_dir: str, entry: Dict) -> bytes:
+    with open(os.path.join(out_dir, entry["shard"]), "rb") as f:
+        f.seek(int(entry["offset"]))
+        return f.read(int(entry["size"]))
@@ -3,41 +3,74 @@ from typing import Dict, Iterable, List, Optional
 
 import requests
 
+from .http_pool import HttpPool
+from .rate_limit import THROTTLE_STATUS, AdaptiveLimiter, parse_retry_after
+from .response_cache import ResponseCache
+
 
 RETRYABLE_STATUS = {429, 502, 503, 504}
 
 
 class WikiAPI:
-    def __init__(self, api_url: str, user_agent: str, max_retries: int = 8):
+    def __init__(self, api_url: str, user_agent: str, max_retries: int = 8, rate_limit: Optional[float] = None,
+                 pool: Optional[HttpPool] = None, cache: Optional[ResponseCache] = None,
+                 limiter: Optional[AdaptiveLimiter] = None):
         self.api_url = api_url
         self.user_agent = user_agent
         self.max_retries = max_retries
-        self._reset_session()
+        self.limiter = limiter or AdaptiveLimiter(rate=rate_limit)
+        self.pool = pool or HttpPool(user_agent)
+        self.cache = cache
 
-    def _reset_session(self) -> None:
-        self.s = requests.Session()
-        self.s.headers.update({"User-Agent": self.user_agent, "Connection": "close"})
+    def get_json(self, params: Dict, use_cache: bool = True) -> Dict:
+        cache = self.cache if use_cache else None
+        key = None
+        cached = None
+        headers: Dict[str, str] = {}
+        if cache is not None:
+            key = cache.key(self.api_url, params)
+            cached = cache.get(key)
+            if cached is not None and (cached.fresh or cache.offline):
+                return cached.data
+            if cache.offline:
+                raise RuntimeError(f"WikiAPI cache miss in offline mode: {params}")
+            if cached is not None:
+                if cached.etag:
+                    headers["If-None-Match"] = cached.etag
+                if cached.last_modified:
+                    headers["If-Modified-Since"] = cached.last_modified
 
-    def get_json(self, params: Dict) -> Dict:
         last_err: Optional[Exception] = None
         for attempt in range(self.max_retries):
-            try:
-                r = self.s.get(self.api_url, params=params, timeout=30)
-                if r.status_code in RETRYABLE_STATUS:
-                    time.sleep(min(20.0, 2 ** attempt))
-                    continue
-                r.raise_for_status()
-                return r.json()
-            except (requests.exceptions.SSLError,
-                    requests.exceptions.ConnectionError,
-                    requests.exceptions.Timeout) as e:
-                last_err = e
-                time.sleep(min(20.0, 2 ** attempt))
+            delay = 0.0
+            with self.limiter.slot():
+                t0 = time.monotonic()
                 try:
-                    self.s.close()
-                except Exception:
-                    pass
-                self._reset_session()
+                    r = self.pool.get(self.api_url, params=params, headers=headers, timeout=30)
+                    if r.status_code in THROTTLE_STATUS:
+                        retry_after = parse_retry_after(r.headers)
+                        last_err = RuntimeError(f"HTTP {r.status_code} (Retry-After: {retry_after})")
+                        self.limiter.throttled(attempt, retry_after, started=t0)
+                        continue
+                    if r.status_code in RETRYABLE_STATUS:
+                        last_err = RuntimeError(f"HTTP {r.status_code}")
+                        delay = self.limiter.failed(attempt, started=t0)
+                    else:
+                        self.limiter.success(time.monotonic() - t0)
+                        if r.status_code == 304 and cached is not None:
+                            cache.touch(key)
+                            return cached.data
+                        r.raise_for_status()
+                        data = r.json()
+                        if cache is not None and "error" not in data:
+                            cache.put(key, data, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                        return data
+                except (requests.exceptions.SSLError,
+                        requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as e:
+                    last_err = e
+                    delay = self.limiter.failed(attempt, started=t0)
+            time.sleep(delay)
         raise RuntimeError(f"WikiAPI failed after retries: {last_err}")
 
     def iter_category_members(self, category_title: str) -> Iterable[Dict]:
@@ -81,3 +114,54 @@ class WikiAPI:
                 if title and ii:
                     out[title] = ii[0]
         return out
+
+    def iter_changed_files(self, since: str) -> Iterable[Dict]:
+        aicontinue = None
+        while True:
+            params = {
+                "action": "query",
+                "format": "json",
+                "list": "allimages",
+                "aisort": "timestamp",
+                "aidir": "newer",
+                "aistart": since,
+                "ailimit": "500",
+                "aiprop": "url|size|mime|timestamp",
+            }
+            if aicontinue:
+                params["aicontinue"] = aicontinue
+
+            data = self.get_json(params, use_cache=False)
+            for item in data.get("query", {}).get("allimages", []):
+                yield item
+
+            aicontinue = data.get("continue", {}).get("aicontinue")
+            if not aicontinue:
+                return
+
+    def categories_batch(self, titles: List[str], batch_size: int = 50) -> Dict[str, List[str]]:
+        out: Dict[str, List[str]] = {}
+        for i in range(0, len(titles), batch_size):
+            chunk = titles[i:i + batch_size]
+            clcontinue = None
+            while True:
+                params = {
+                    "action": "query",
+                    "format": "json",
+                    "titles": "|".join(chunk),
+                    "prop": "categories",
+                    "cllimit": "max",
+                }
+                if clcontinue:
+                    params["clcontinue"] = clcontinue
+
+                data = self.get_json(params, use_cache=False)
+                for page in data.get("query", {}).get("pages", {}).values():
+                    title = page.get("title")
+                    if title:
+                        out.setdefault(title, []).extend(c["title"] for c in page.get("categories", []))
+
+                clcontinue = data.get("continue", {}).get("clcontinue")
+                if not clcontinue:
+                    break
+        return out
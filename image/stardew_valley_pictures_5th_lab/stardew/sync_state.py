@@ -0,0 +1,63 @@
+import csv
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class SyncDelta:
+    known: Dict[str, Dict] = field(default_factory=dict)
+    changed: Dict[str, Dict] = field(default_factory=dict)
+    categories: Dict[str, List[str]] = field(default_factory=dict)
+
+    def reusable_row(self, file_title: str) -> Optional[Dict]:
+        if file_title in self.changed:
+            return None
+        row = self.known.get(file_title)
+        if row is None or not row.get("image_path") or not os.path.exists(row["image_path"]):
+            return None
+        return row
+
+    def extra_members(self, roots: List[str], candidates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        cats = set(roots)
+        have = set()
+        for cat, ft in candidates:
+            cats.add(cat)
+            have.add(ft)
+
+        out: List[Tuple[str, str]] = []
+        for ft in self.changed:
+            if ft in have:
+                continue
+            for cat in self.categories.get(ft, []):
+                if cat in cats:
+                    out.append((cat, ft))
+                    break
+        return out
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def load_watermark(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("watermark")
+
+
+def save_watermark(path: str, watermark: str) -> None:
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"watermark": watermark}, f)
+    os.replace(tmp, path)
+
+
+def read_metadata(path: str) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return {row["file_title"]: row for row in csv.DictReader(f)}
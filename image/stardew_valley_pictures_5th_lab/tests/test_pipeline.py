@@ -0,0 +1,159 @@
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stardew.pipeline import Pipeline  # noqa: E402
+
+JOIN_TIMEOUT = 10
+
+
+def join_or_fail(pipe: Pipeline) -> None:
+    errors = []
+
+    def run():
+        try:
+            pipe.join()
+        except BaseException as e:
+            errors.append(e)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    t.join(JOIN_TIMEOUT)
+    assert not t.is_alive(), "Pipeline.join() hung"
+    if errors:
+        raise errors[0]
+
+
+def produce(n, out):
+    for i in range(n):
+        if not out.put(i):
+            break
+    out.close()
+
+
+def relay(inp, out):
+    for item in inp:
+        if not out.put(item):
+            break
+    out.close()
+
+
+def failing_relay(inp, out, after):
+    # closes in finally like the builder stages, so close() runs after the error
+    try:
+        for i, item in enumerate(inp):
+            if i == after:
+                raise RuntimeError("stage failed")
+            out.put(item)
+    finally:
+        out.close()
+
+
+def test_consumer_early_exit_with_full_queues():
+    # mirrors build_generative_dataset(max_total=...): the writer stops reading while every
+    # upstream stage is blocked on a full channel and still has to close it
+    pipe = Pipeline()
+    first = pipe.channel("first", maxsize=2)
+    rows = pipe.channel("rows", maxsize=2, producers=3)
+    pipe.spawn("source", produce, 1000, first)
+    for i in range(3):
+        pipe.spawn(f"relay-{i}", relay, first, rows)
+
+    taken = []
+    for row in rows:
+        taken.append(row)
+        if len(taken) >= 5:
+            pipe.stop.set()
+            break
+
+    join_or_fail(pipe)
+    assert len(taken) == 5
+
+
+def test_stage_error_with_full_downstream_is_raised():
+    pipe = Pipeline()
+    first = pipe.channel("first", maxsize=2)
+    rows = pipe.channel("rows", maxsize=1)
+    pipe.spawn("source", produce, 1000, first)
+    pipe.spawn("relay", failing_relay, first, rows, 1)
+
+    # nobody drains rows, so the failing stage's downstream is full when it raises
+    with pytest.raises(RuntimeError, match="stage failed"):
+        join_or_fail(pipe)
+
+
+def test_all_items_delivered_without_stop():
+    pipe = Pipeline()
+    first = pipe.channel("first", maxsize=3)
+    rows = pipe.channel("rows", maxsize=3, producers=2)
+    pipe.spawn("source", produce, 200, first)
+    for i in range(2):
+        pipe.spawn(f"relay-{i}", relay, first, rows)
+
+    taken = sorted(rows)
+    join_or_fail(pipe)
+    assert taken == list(range(200))
+
+
+class RacingQueue(queue.Queue):
+    # the first timed get() that comes back empty lets the producer put its last items and
+    # close the channel inside the window between the timeout and the consumer's check
+    def __init__(self, maxsize, on_timeout):
+        super().__init__(maxsize)
+        self.on_timeout = on_timeout
+
+    def get(self, block=True, timeout=None):
+        try:
+            return super().get(block, timeout)
+        except queue.Empty:
+            if self.on_timeout is not None:
+                hook, self.on_timeout = self.on_timeout, None
+                hook()
+            raise
+
+
+def racing_channel(items):
+    pipe = Pipeline()
+    ch = pipe.channel("rows", maxsize=10)
+
+    def finish():
+        for item in items:
+            ch.put(item)
+        ch.close()
+
+    ch._q = RacingQueue(10, finish)
+    return ch
+
+
+def test_iter_delivers_items_put_just_before_close():
+    ch = racing_channel([1, 2])
+    assert list(ch) == [1, 2]
+
+
+def test_batches_deliver_items_put_just_before_close():
+    ch = racing_channel([1, 2])
+    assert [item for batch in ch.batches(10, linger=60) for item in batch] == [1, 2]
+
+
+def test_concurrent_put_and_close_with_blocked_consumer():
+    for _ in range(50):
+        pipe = Pipeline()
+        ch = pipe.channel("rows", maxsize=10)
+        started = threading.Event()
+
+        def produce_late():
+            started.wait()
+            for i in range(3):
+                ch.put(i)
+            ch.close()
+
+        t = threading.Thread(target=produce_late)
+        t.start()
+        started.set()
+        assert list(ch) == [0, 1, 2]
+        t.join()
@@ -0,0 +1,80 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+from crawler import BookCrawler
+from parser import BookParser
+
+ENGINES = {
+    'soup': BookParser.parse_books_soup,
+    'fast': BookParser.parse_books_fast,
+}
+
+
+def record_corpus(corpus_dir: str, pages: int) -> None:
+    os.makedirs(corpus_dir, exist_ok=True)
+    crawler = BookCrawler()
+    for page_num, page_content in crawler.iter_pages(range(1, pages + 1)):
+        if page_content:
+            with open(os.path.join(corpus_dir, f"page_{page_num:05d}.html"), 'w', encoding='utf-8') as f:
+                f.write(page_content)
+    print(f"Сохранено страниц: {len(os.listdir(corpus_dir))} в {corpus_dir}")
+
+
+def load_corpus(corpus_dir: str) -> list[tuple[int, str]]:
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(corpus_dir, name), encoding='utf-8') as f:
+                pages.append((int(name[5:10]), f.read()))
+    return pages
+
+
+def run_engine(parse, pages):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [parse(page_content, page_num) for page_num, page_content in pages]
+
+
+def benchmark(corpus_dir: str, repeat: int) -> None:
+    pages = load_corpus(corpus_dir)
+    if not pages:
+        print(f"Нет страниц в {corpus_dir}")
+        return
+
+    outputs = {}
+    for name, parse in ENGINES.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = run_engine(parse, pages)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        books = sum(len(b) for b in outputs[name])
+        print(f"{name}: {len(pages) / best:.1f} стр/с, {books} книг, {best:.3f} с на {len(pages)} стр.")
+
+    mismatches = [
+        page_num for (page_num, _), soup_books, fast_books
+        in zip(pages, outputs['soup'], outputs['fast'])
+        if soup_books != fast_books
+    ]
+    if mismatches:
+        print(f"Результаты различаются на страницах: {mismatches[:20]}")
+    else:
+        print("Результаты идентичны")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('corpus', help='каталог с сохранёнными HTML-страницами')
+    ap.add_argument('--record', type=int, default=0, help='сначала скачать и сохранить N страниц каталога')
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+
+    if args.record:
+        record_corpus(args.corpus, args.record)
+    benchmark(args.corpus, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
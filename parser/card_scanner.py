@@ -0,0 +1,81 @@
+import re
+import hashlib
+from html import unescape
+
+CARD_CLASS = 'product-card'
+
+TAG_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<script\b.*?</script\s*>'
+    r'|<style\b.*?</style\s*>'
+    r'|<div\b((?:"[^"]*"|\'[^\']*\'|[^\'">])*)>'
+    r'|(</div\s*>)',
+    re.IGNORECASE | re.DOTALL,
+)
+ATTR_RE = re.compile(r'''([^\s/>="']+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]*))?''')
+
+
+class ScannedCard:
+    __slots__ = ('attrs', 'start', 'end')
+
+    def __init__(self, attrs: dict, start: int):
+        self.attrs = attrs
+        self.start = start
+        self.end = None
+
+
+def parse_attrs(raw: str) -> dict:
+    attrs = {}
+    for name, value in ATTR_RE.findall(raw):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attrs[name.lower()] = unescape(value) if '&' in value else value
+    return attrs
+
+
+def scan_cards(page_content: str) -> list[ScannedCard]:
+    cards = []
+    open_cards = []
+    depth = 0
+    for match in TAG_RE.finditer(page_content):
+        raw, close = match.group(1), match.group(2)
+        if close is not None:
+            depth = max(0, depth - 1)
+            if open_cards and open_cards[-1][0] == depth:
+                open_cards.pop()[1].end = match.end()
+            continue
+        if raw is None:
+            continue
+
+        self_closing = raw.rstrip().endswith('/')
+        if not self_closing:
+            depth += 1
+        if CARD_CLASS not in raw:
+            continue
+        attrs = parse_attrs(raw)
+        if CARD_CLASS in attrs.get('class', '').split():
+            card = ScannedCard(attrs, match.start())
+            cards.append(card)
+            if self_closing:
+                card.end = match.end()
+            else:
+                open_cards.append((depth - 1, card))
+    return cards
+
+
+def card_fragment(page_content: str, cards: list[ScannedCard], i: int) -> str:
+    card = cards[i]
+    if card.end is None or (i + 1 < len(cards) and cards[i + 1].start < card.end):
+        return None
+    return page_content[card.start:card.end]
+
+
+def cards_digest(page_content: str) -> str:
+    cards = scan_cards(page_content)
+    digest = hashlib.sha1()
+    for i, card in enumerate(cards):
+        end = card.end
+        if end is None:
+            end = cards[i + 1].start if i + 1 < len(cards) else len(page_content)
+        digest.update(page_content[card.start:end].encode('utf-8'))
+    return digest.hexdigest()
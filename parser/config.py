@@ -13,4 +13,15 @@ HEADERS = {
 MIN_DELAY = 0.1
 MAX_DELAY = 0.2
 
-OUTPUT_CSV = 'books_bookvoed.csv'
\ No newline at end of file
+CRAWL_WORKERS = 8
+MAX_PER_HOST = 8
+PARSE_WORKERS = None
+PARSE_QUEUE = 32
+PARSE_ENGINE = 'fast'
+
+OUTPUT_CSV = 'books_bookvoed.csv'
+OUTPUT_FORMAT = 'csv'
+SINK_BATCH_SIZE = 1000
+
+FINGERPRINT_DB = 'bookvoed_fingerprints.sqlite'
+CHANGES_CSV = 'books_changes.csv'
\ No newline at end of file
@@ -1,36 +1,114 @@
 import requests
 import time
 import random
-from config import HEADERS, MIN_DELAY, MAX_DELAY, BASE_URL
-from multiprocessing import Pool
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from config import HEADERS, MIN_DELAY, MAX_DELAY, BASE_URL, CRAWL_WORKERS, MAX_PER_HOST
+from stage_timer import StageTimer
+
+
+class PolitenessGate:
+    def __init__(self, min_delay: float = MIN_DELAY, max_delay: float = MAX_DELAY):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next_at)
+            self._next_at = at + random.uniform(self.min_delay, self.max_delay)
+        if at > now:
+            time.sleep(at - now)
+
 
 class BookCrawler:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
-    
-    def fetch_page(self, url: str) -> str:
+    def __init__(self, max_per_host: int = MAX_PER_HOST, timer: StageTimer = None):
+        self.timer = timer or StageTimer()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host)
+        self.gate = PolitenessGate()
+        self.max_per_host = max_per_host
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self._local.session = session
+        return session
+
+    def host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._hosts[host]
+
+    def fetch_response(self, url: str, headers: dict = None) -> requests.Response:
         try:
-            response = self.session.get(url, timeout=10)
+            start = time.perf_counter()
+            with self.host_slot(url):
+                self.gate.wait()
+                self.timer.record('gate_wait', time.perf_counter() - start)
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(url, timeout=10, headers=headers)
+                finally:
+                    self.timer.record('fetch', time.perf_counter() - start)
             response.raise_for_status()
-            time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
-            return response.text
+            return response
         except requests.RequestException as e:
             print(f"Ошибка в скачивании страницы {url}: {e}")
             return None
-    
+
+    def fetch_page(self, url: str) -> str:
+        response = self.fetch_response(url)
+        return response.text if response is not None else None
+
     def get_page_url(self, page_num: int) -> str:
         if page_num == 1:
             return BASE_URL
         else:
             return f"{BASE_URL}?page={page_num}"
 
+    def fetch_page_num(self, page_num: int) -> str:
+        return self.fetch_page(self.get_page_url(page_num))
+
+    def fetch_page_conditional(self, page_num: int, etag: str = None, last_modified: str = None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        return self.fetch_response(self.get_page_url(page_num), headers)
+
+    def iter_pages(self, page_nums, workers: int = CRAWL_WORKERS, fetch=None):
+        fetch = fetch or self.fetch_page_num
+        page_nums = iter(page_nums)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            window = deque()
+            for page_num in page_nums:
+                window.append((page_num, ex.submit(fetch, page_num)))
+                if len(window) >= workers * 2:
+                    break
+            while window:
+                page_num, fut = window.popleft()
+                for next_num in page_nums:
+                    window.append((next_num, ex.submit(fetch, next_num)))
+                    break
+                yield page_num, fut.result()
 
-def fetch_page_parallel(page_num: int, crawler: BookCrawler):
-    url = crawler.get_page_url(page_num)
-    return crawler.fetch_page(url)
 
-def fetch_all_pages_parallel(page_nums, crawler):
-    with Pool(processes=4) as pool:
-        results = pool.starmap(fetch_page_parallel, [(page_num, crawler) for page_num in page_nums])
-    return results
+def fetch_all_pages_parallel(page_nums, crawler: BookCrawler, workers: int = CRAWL_WORKERS):
+    return [content for _, content in crawler.iter_pages(page_nums, workers)]
@@ -1,17 +1,113 @@
+import os
+import dataclasses
+from array import array
+import numpy as np
 import pandas as pd
-from models import Book
-from config import OUTPUT_CSV
+from models import Book, BookBatch, BOOK_FIELDS
+from config import OUTPUT_CSV, OUTPUT_FORMAT, SINK_BATCH_SIZE
 
+PARQUET_TYPES = {str: 'string', float: 'float64', int: 'int64'}
 
-class DataProcessor:
-    @staticmethod
-    def save_to_csv(books: list[Book], filename: str = OUTPUT_CSV) -> None:
-        if books:
-            data = [book.__dict__ for book in books]
-            df = pd.DataFrame(data)
-            df.to_csv(filename, index=False, encoding='utf-8')
-            print(f"Данные сохранены в {filename}")
-            print(f"Размер датасета: {len(df)} строк, {len(df.columns)} столбцов")
+
+class BookSink:
+    def __init__(self, filename: str = OUTPUT_CSV, fmt: str = OUTPUT_FORMAT, batch_size: int = SINK_BATCH_SIZE):
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.filename = filename
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.tmp_filename = filename + '.part'
+        self.rows = 0
+        self._batch = BookBatch()
+        self._writer = None
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
         else:
+            self.abort()
+        return False
+
+    def write(self, books) -> None:
+        if isinstance(books, BookBatch):
+            self._batch.extend(books)
+        else:
+            for book in books:
+                self._batch.append(book)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not len(self._batch):
+            return
+        columns = self._batch.columns
+        df = pd.DataFrame({
+            name: np.frombuffer(values, dtype=values.typecode) if isinstance(values, array) else values
+            for name, values in columns.items()
+        }, columns=BOOK_FIELDS)
+        if self.fmt == 'csv':
+            self._write_csv(df)
+        else:
+            self._write_parquet(df)
+        self.rows += len(self._batch)
+        self._batch = BookBatch()
+
+    def _write_csv(self, df: pd.DataFrame) -> None:
+        if self._file is None:
+            self._file = open(self.tmp_filename, 'w', encoding='utf-8', newline='')
+        df.to_csv(self._file, index=False, header=self.rows == 0)
+        self._file.flush()
+
+    def _write_parquet(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            schema = pa.schema([
+                (f.name, pa.type_for_alias(PARQUET_TYPES.get(f.type, 'string')))
+                for f in dataclasses.fields(Book)
+            ])
+            self._writer = pq.ParquetWriter(self.tmp_filename, schema)
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False))
+
+    def _close_files(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self) -> None:
+        self.flush()
+        self._close_files()
+        if not self.rows:
             print("Нет данных для сохранения")
+            return
+        os.replace(self.tmp_filename, self.filename)
+        print(f"Данные сохранены в {self.filename}")
+        print(f"Размер датасета: {self.rows} строк, {len(BOOK_FIELDS)} столбцов")
+
+    def abort(self) -> None:
+        self.flush()
+        self._close_files()
+        if self.rows:
+            print(f"Сбор прерван, частичные данные ({self.rows} строк) сохранены в {self.tmp_filename}")
+
 
+class DataProcessor:
+    @staticmethod
+    def open_sink(filename: str = None, fmt: str = OUTPUT_FORMAT, batch_size: int = SINK_BATCH_SIZE) -> BookSink:
+        if filename is None:
+            filename = OUTPUT_CSV if fmt == 'csv' else os.path.splitext(OUTPUT_CSV)[0] + '.parquet'
+        return BookSink(filename, fmt, batch_size)
+
+    @staticmethod
+    def save_to_csv(books: list[Book], filename: str = OUTPUT_CSV) -> None:
+        with BookSink(filename, 'csv', batch_size=max(1, len(books))) as sink:
+            sink.write(books)
@@ -0,0 +1,95 @@
+import os
+import csv
+import sqlite3
+import time
+from models import BookBatch, BOOK_FIELDS
+from config import FINGERPRINT_DB
+
+CHANGE_FIELDS = ['change', 'title', 'publisher', 'category', 'availability', 'price_before', 'price']
+
+BOOK_COLUMNS = ', '.join(BOOK_FIELDS)
+
+DIFF_SQL = '''
+WITH old AS (
+    SELECT title, publisher, MIN(category) AS category, MIN(availability) AS availability, MIN(price) AS price
+    FROM books GROUP BY title, publisher
+), new AS (
+    SELECT title, publisher, MIN(category) AS category, MIN(availability) AS availability, MIN(price) AS price
+    FROM crawl GROUP BY title, publisher
+)
+SELECT 'new', n.title, n.publisher, n.category, n.availability, NULL, n.price
+FROM new n LEFT JOIN old o ON o.title = n.title AND o.publisher = n.publisher
+WHERE o.title IS NULL
+UNION ALL
+SELECT 'removed', o.title, o.publisher, o.category, o.availability, o.price, NULL
+FROM old o LEFT JOIN new n ON o.title = n.title AND o.publisher = n.publisher
+WHERE n.title IS NULL
+UNION ALL
+SELECT 'repriced', n.title, n.publisher, n.category, n.availability, o.price, n.price
+FROM new n JOIN old o ON o.title = n.title AND o.publisher = n.publisher
+WHERE n.price != o.price
+'''
+
+
+class FingerprintStore:
+    def __init__(self, path: str = FINGERPRINT_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS pages (
+                page_num INTEGER PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                checked_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS books (page_num INTEGER, {BOOK_COLUMNS});
+            CREATE INDEX IF NOT EXISTS books_page ON books(page_num);
+            CREATE INDEX IF NOT EXISTS books_key ON books(title, publisher);
+            CREATE TEMP TABLE crawl (page_num INTEGER, {BOOK_COLUMNS});
+            CREATE INDEX temp.crawl_key ON crawl(title, publisher);
+        ''')
+        self._pages = {}
+
+    def validators(self) -> dict:
+        rows = self.conn.execute('SELECT page_num, etag, last_modified, content_hash FROM pages')
+        return {page_num: (etag, last_modified, content_hash) for page_num, etag, last_modified, content_hash in rows}
+
+    def keep_page(self, page_num: int) -> None:
+        self.conn.execute(f'INSERT INTO crawl SELECT page_num, {BOOK_COLUMNS} FROM books WHERE page_num = ?',
+                          (page_num,))
+
+    def touch_page(self, page_num: int, etag: str, last_modified: str, content_hash: str) -> None:
+        self._pages[page_num] = (etag, last_modified, content_hash, time.time())
+
+    def stage_page(self, page_num: int, books: BookBatch, etag: str, last_modified: str, content_hash: str) -> None:
+        columns = [books.columns[name] for name in BOOK_FIELDS]
+        placeholders = ', '.join('?' * (len(BOOK_FIELDS) + 1))
+        self.conn.executemany(f'INSERT INTO crawl VALUES ({placeholders})',
+                              ((page_num, *row) for row in zip(*columns)))
+        self.touch_page(page_num, etag, last_modified, content_hash)
+
+    def write_changes(self, filename: str) -> dict:
+        counts = {'new': 0, 'removed': 0, 'repriced': 0}
+        tmp_filename = filename + '.part'
+        with open(tmp_filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CHANGE_FIELDS)
+            for row in self.conn.execute(DIFF_SQL):
+                writer.writerow(row)
+                counts[row[0]] += 1
+        os.replace(tmp_filename, filename)
+        return counts
+
+    def commit(self) -> None:
+        with self.conn:
+            self.conn.execute('DELETE FROM books')
+            self.conn.execute(f'INSERT INTO books SELECT page_num, {BOOK_COLUMNS} FROM crawl')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO pages (page_num, etag, last_modified, content_hash, checked_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                ((page_num, *values) for page_num, values in self._pages.items()),
+            )
+        self._pages = {}
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,44 +1,130 @@
+import argparse
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from crawler import BookCrawler
-from parser import BookParser
+from parser import parse_page_timed
 from data_processor import DataProcessor
-from config import PAGE_LIMIT
+from fingerprint_store import FingerprintStore
+from stage_timer import StageTimer
+from config import PAGE_LIMIT, CRAWL_WORKERS, PARSE_WORKERS, PARSE_QUEUE, CHANGES_CSV
 
 
 class MainProcess:
     def __init__(self):
-        self.crawler = BookCrawler()
-        self.parser = BookParser()
+        self.timer = StageTimer()
+        self.crawler = BookCrawler(timer=self.timer)
         self.processor = DataProcessor()
+        self.validators = {}
 
-    def fetch_and_parse_page(self, page_num):
-        url = self.crawler.get_page_url(page_num)
-        page_content = self.crawler.fetch_page(url)
+    def fetch_conditional(self, page_num):
+        etag, last_modified, _ = self.validators.get(page_num, (None, None, None))
+        return self.crawler.fetch_page_conditional(page_num, etag, last_modified)
 
-        if page_content:
-            books = self.parser.parse_books(page_content, page_num)
-            print(f"{url}")
-            return books
-        return []
+    def collect_parsed(self, page_num, validators, future, sink, store):
+        start = time.perf_counter()
+        books, parse_seconds, content_hash = future.result()
+        self.timer.record('parse_wait', time.perf_counter() - start)
+        self.timer.record('parse', parse_seconds)
+        if books is None:
+            self.skip_unchanged(page_num, store, *validators, content_hash)
+            return
 
-    def crawl_site(self):
-        all_books = []
+        print(f"{self.crawler.get_page_url(page_num)}")
+        start = time.perf_counter()
+        if store is not None:
+            store.stage_page(page_num, books, *validators, content_hash)
+        if sink is not None:
+            sink.write(books)
+        self.timer.record('write', time.perf_counter() - start)
+        self.collected += len(books)
+        print(f"Всего книг собрано: {self.collected}")
+
+    def skip_unchanged(self, page_num, store, etag, last_modified, content_hash):
+        old_etag, old_last_modified, _ = self.validators.get(page_num, (None, None, None))
+        store.keep_page(page_num)
+        store.touch_page(page_num, etag or old_etag, last_modified or old_last_modified, content_hash)
+        self.unchanged += 1
+
+    def crawl_site(self, sink, store, incremental=False):
+        self.collected = 0
+        self.unchanged = 0
+        self.validators = store.validators() if incremental else {}
+        fingerprint = store is not None
         page_nums = range(1, PAGE_LIMIT + 1)
+        pages = self.crawler.iter_pages(page_nums, CRAWL_WORKERS, fetch=self.fetch_conditional)
+        pending = deque()
+
+        # spawn, not fork: the fetch threads of iter_pages are already running when workers start
+        with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                start = time.perf_counter()
+                item = next(pages, None)
+                self.timer.record('fetch_wait', time.perf_counter() - start)
+                if item is None:
+                    break
+
+                page_num, response = item
+                if response is None:
+                    if store is not None:
+                        store.keep_page(page_num)
+                    continue
+
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                old_hash = self.validators.get(page_num, (None, None, None))[2]
+                if response.status_code == 304:
+                    self.skip_unchanged(page_num, store, etag, last_modified, old_hash)
+                    continue
 
-        for page_num in page_nums:
-            books = self.fetch_and_parse_page(page_num)
-            all_books.extend(books)
+                # the card digest is taken in the worker, which skips parsing when it matches old_hash
+                future = pool.submit(parse_page_timed, response.text, page_num, fingerprint, old_hash)
+                pending.append((page_num, (etag, last_modified), future))
+                while len(pending) >= PARSE_QUEUE:
+                    self.collect_parsed(*pending.popleft(), sink, store)
 
-            print(f"Всего книг собрано: {len(all_books)}")
+            while pending:
+                self.collect_parsed(*pending.popleft(), sink, store)
 
-        return all_books
+        self.timer.report()
+        print(f"Страниц без изменений: {self.unchanged} из {len(page_nums)}")
+        return self.collected
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--incremental', action='store_true',
+                    help='условные запросы и разбор только изменившихся страниц; результат - лента изменений')
+    ap.add_argument('--no-fingerprints', action='store_true',
+                    help='полная выгрузка без сохранения отпечатков страниц и ленты изменений')
+    args = ap.parse_args()
+    if args.incremental and args.no_fingerprints:
+        ap.error('--incremental требует отпечатков страниц')
+    return args
 
-    def save_books(self, books):
-        self.processor.save_to_csv(books)
 
 def main():
+    args = parse_args()
     process = MainProcess()
-    books = process.crawl_site()
-    process.save_books(books)
+    if args.no_fingerprints:
+        with process.processor.open_sink() as sink:
+            process.crawl_site(sink, None)
+        return
+
+    store = FingerprintStore()
+    try:
+        if args.incremental:
+            process.crawl_site(None, store, incremental=True)
+        else:
+            with process.processor.open_sink() as sink:
+                process.crawl_site(sink, store)
+
+        changes = store.write_changes(CHANGES_CSV)
+        store.commit()
+        print(f"Изменения: {changes}, сохранены в {CHANGES_CSV}")
+    finally:
+        store.close()
 
 
 if __name__ == '__main__':
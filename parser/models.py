@@ -1,7 +1,25 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from array import array
 import re
+import sys
 
-@dataclass
+
+def _card_labels(attrs) -> tuple[str, str, str]:
+    # attrs is either the scanned attribute dict or a bs4 Tag; both have .get()
+    publisher = attrs.get('data-product-brand', 'Неизвестно')
+
+    category = attrs.get('data-product-category', 'Книги')
+    if category and '|||' in category:
+        category = category.split('|||')[0]
+
+    availability = attrs.get('data-product-status', 'В наличии')
+    if not availability or availability == '1':
+        availability = 'В наличии'
+
+    return publisher, category, availability
+
+
+@dataclass(slots=True)
 class Book:
     title: str
     price: float
@@ -12,6 +30,31 @@ class Book:
     availability: str
     target: float
 
+    @classmethod
+    def from_attrs(cls, attrs: dict):
+        title = attrs.get('data-product-name', '')
+        price_discounted = attrs.get('data-product-price-discounted')
+        price_total = attrs.get('data-product-price-total')
+        if not title or not price_discounted:
+            return None
+
+        try:
+            price = float(price_discounted)
+            old_price = float(price_total) if price_total else 0.0
+        except ValueError:
+            return None
+        if price == 0:
+            return None
+
+        discount_percent = 0
+        if old_price > 0 and price > 0:
+            discount_percent = int(((old_price - price) / old_price) * 100)
+
+        publisher, category, availability = _card_labels(attrs)
+
+        return cls(title, price, old_price, discount_percent, publisher,
+                   category, availability, price)
+
     @classmethod
     def from_html(cls, book_html):
         try:
@@ -53,15 +96,7 @@ class Book:
             if old_price > 0 and price > 0:
                 discount_percent = int(((old_price - price) / old_price) * 100)
 
-            publisher = book_html.get('data-product-brand', 'Неизвестно')
-
-            category = book_html.get('data-product-category', 'Книги')
-            if category and '|||' in category:
-                category = category.split('|||')[0]
-
-            availability = book_html.get('data-product-status', 'В наличии')
-            if not availability or availability == '1':
-                availability = 'В наличии'
+            publisher, category, availability = _card_labels(book_html)
 
             target = price
 
@@ -71,3 +106,46 @@ class Book:
         except Exception as e:
             print(f"Ошибка при создании объекта книги: {e}")
             return None
+
+
+BOOK_FIELDS = [f.name for f in fields(Book)]
+ARRAY_TYPES = {float: 'd', int: 'q'}
+INTERNED_FIELDS = ('publisher', 'category', 'availability')
+
+
+class BookBatch:
+    __slots__ = ('columns',)
+
+    def __init__(self):
+        self.columns = {
+            f.name: array(ARRAY_TYPES[f.type]) if f.type in ARRAY_TYPES else []
+            for f in fields(Book)
+        }
+
+    def __len__(self) -> int:
+        return len(self.columns['title'])
+
+    def append(self, book: Book) -> None:
+        for name in BOOK_FIELDS:
+            value = getattr(book, name)
+            if name in INTERNED_FIELDS:
+                value = sys.intern(value)
+            self.columns[name].append(value)
+
+    def extend(self, other: 'BookBatch') -> None:
+        for name in BOOK_FIELDS:
+            values = other.columns[name]
+            if name in INTERNED_FIELDS:
+                values = [sys.intern(v) for v in values]
+            self.columns[name].extend(values)
+
+    def books(self):
+        for row in zip(*(self.columns[name] for name in BOOK_FIELDS)):
+            yield Book(*row)
+
+    @classmethod
+    def from_books(cls, books: list[Book]) -> 'BookBatch':
+        batch = cls()
+        for book in books:
+            batch.append(book)
+        return batch
@@ -1,9 +1,38 @@
+import time
 from bs4 import BeautifulSoup
-from models import Book
+from models import Book, BookBatch
+from card_scanner import scan_cards, card_fragment, cards_digest
+from config import PARSE_ENGINE
 
 class BookParser:
     @staticmethod
-    def parse_books(page_content: str, page_num: int) -> list[Book]:
+    def parse_books(page_content: str, page_num: int, engine: str = PARSE_ENGINE) -> list[Book]:
+        if engine == 'fast':
+            return BookParser.parse_books_fast(page_content, page_num)
+        return BookParser.parse_books_soup(page_content, page_num)
+
+    @staticmethod
+    def parse_books_fast(page_content: str, page_num: int) -> list[Book]:
+        if not page_content:
+            return []
+
+        cards = scan_cards(page_content)
+        books = []
+        for i, card in enumerate(cards):
+            book = Book.from_attrs(card.attrs)
+            if book is None:
+                fragment = card_fragment(page_content, cards, i)
+                if fragment is None:
+                    return BookParser.parse_books_soup(page_content, page_num)
+                book_html = BeautifulSoup(fragment, 'html.parser').find('div', class_='product-card')
+                book = Book.from_html(book_html)
+            books.append(book)
+
+        print(f"Страница {page_num}: найдено {len(cards)} книг")
+        return [book for book in books if book]
+
+    @staticmethod
+    def parse_books_soup(page_content: str, page_num: int) -> list[Book]:
         if not page_content:
             return []
             
@@ -20,3 +49,13 @@ class BookParser:
                 books.append(book)
         
         return books
+
+
+def parse_page_timed(page_content: str, page_num: int, fingerprint: bool = False,
+                     old_hash: str | None = None) -> tuple[BookBatch | None, float, str | None]:
+    start = time.perf_counter()
+    content_hash = cards_digest(page_content) if fingerprint else None
+    if content_hash is not None and content_hash == old_hash:
+        return None, time.perf_counter() - start, content_hash
+    books = BookBatch.from_books(BookParser.parse_books(page_content, page_num))
+    return books, time.perf_counter() - start, content_hash
@@ -0,0 +1,29 @@
+import threading
+
+
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            count, total, worst = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(worst, seconds))
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    'count': count,
+                    'total': round(total, 2),
+                    'avg': round(total / count, 4) if count else 0.0,
+                    'max': round(worst, 4),
+                }
+                for stage, (count, total, worst) in self._stages.items()
+            }
+
+    def report(self) -> None:
+        print("Время по этапам:")
+        for stage, stats in self.summary().items():
+            print(f"  {stage}: {stats}")
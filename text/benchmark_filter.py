@@ -0,0 +1,99 @@
+import argparse
+import random
+import re
+import time
+
+from review_filter import ReviewFilter
+
+WORDS = [
+    "игра", "ферма", "очень", "затягивает", "урожай", "рыбалка", "шахта", "Пеликан", "город",
+    "game", "farm", "relaxing", "co-op", "mods", "10/10", "лучшая", "инди", "😊", "ёлка", "",
+]
+
+
+def reference_accept(rf: ReviewFilter, text: str, language: str) -> bool:
+    # ReviewFilter.accept as it was before the batch API; kept to check the outputs match
+    if not text:
+        return False
+    t = text.strip()
+
+    if len(t) < rf.min_chars:
+        return False
+
+    if not re.search(r"[A-Za-zА-Яа-яЁё0-9]", t):
+        return False
+
+    words = re.findall(r"[A-Za-zА-Яа-яЁё0-9]+", t)
+    if len(words) < rf.min_words:
+        return False
+
+    if rf.require_cyrillic and language == "russian":
+        letters = [ch for ch in t if ch.isalpha()]
+        if not letters:
+            return False
+        cyr = sum(("а" <= ch.lower() <= "я") or (ch.lower() == "ё") for ch in letters)
+        if (cyr / len(letters)) < rf.cyrillic_ratio:
+            return False
+
+    return True
+
+
+def synthetic_reviews(n: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        k = rnd.choice([0, 2, 5, 6, 8, 20, 60])
+        sep = rnd.choice([" ", "  ", "\n", ", ", "!!! "])
+        texts.append("  " + sep.join(rnd.choice(WORDS) for _ in range(k)) + " ")
+    return texts
+
+
+def load_reviews(path: str) -> list:
+    import pandas as pd
+
+    df = pd.read_csv(path, dtype={"review_text": object}, keep_default_na=False)
+    return df["review_text"].tolist()
+
+
+def bench(name, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name}: {best:.3f} s")
+    return list(result)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", help="reviews CSV to use instead of synthetic texts")
+    ap.add_argument("-n", type=int, default=100_000)
+    ap.add_argument("--language", default="russian")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import pandas as pd
+
+    texts = load_reviews(args.csv) if args.csv else synthetic_reviews(args.n)
+    series = pd.Series(texts, dtype=object)
+    rf = ReviewFilter()
+    print("Reviews:", len(texts))
+
+    expected = bench("reference accept", lambda: [reference_accept(rf, t, args.language) for t in texts], args.repeat)
+    results = {
+        "accept": bench("accept", lambda: [rf.accept(t, args.language) for t in texts], args.repeat),
+        "accept_many(list)": bench("accept_many(list)", lambda: rf.accept_many(texts, args.language), args.repeat),
+        "accept_many(Series)": bench("accept_many(Series)", lambda: rf.accept_many(series, args.language),
+                                     args.repeat),
+    }
+
+    print("Accepted:", sum(expected))
+    for name, result in results.items():
+        mismatches = sum(a != b for a, b in zip(expected, result))
+        print(f"{name}: {'identical' if not mismatches else f'{mismatches} mismatches'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,38 @@
+import argparse
+
 import config
 from review_filter import ReviewFilter
 from review_parser import SteamReviewsParser
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    ap.add_argument("--sync", action="store_true", help="only fetch new and edited reviews and upsert them")
+    args = ap.parse_args()
+
     rf = ReviewFilter(min_chars=40, min_words=6, require_cyrillic=True, cyrillic_ratio=0.25)
 
     parser = SteamReviewsParser(
         base_url=config.BASE_URL,
         user_agent=config.USER_AGENT,
         sleep_seconds=0.3,
-        review_filter=rf
+        review_filter=rf,
+        max_chains=4
     )
 
-    parser.save_csv(
-        path="stardew_reviews.csv",
-        total_count=100_000,
-        language="russian",
-        flt="all",
-        only_steam_purchase=True
-    )
+    if args.sync:
+        parser.sync_csv(
+            path="stardew_reviews.csv",
+            language="russian",
+            flt="updated",
+            only_steam_purchase=True
+        )
+    else:
+        parser.save_csv(
+            path="stardew_reviews.csv",
+            total_count=100_000,
+            language="russian",
+            flt=["all", "recent"],
+            only_steam_purchase=True,
+            resume=args.resume
+        )
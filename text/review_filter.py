@@ -1,6 +1,27 @@
 import re
 from dataclasses import dataclass
 
+WORD_PATTERN = r"[A-Za-zА-Яа-яЁё0-9]+"
+WORD_RE = re.compile(WORD_PATTERN)
+
+
+class _CharClasses(dict):
+    # str.translate table: Cyrillic letters -> "c", other letters -> "a", everything else dropped
+    def __missing__(self, code):
+        ch = chr(code)
+        if not ch.isalpha():
+            value = None
+        elif ("а" <= ch.lower() <= "я") or (ch.lower() == "ё"):
+            value = "c"
+        else:
+            value = "a"
+        self[code] = value
+        return value
+
+
+CHAR_CLASSES = _CharClasses()
+
+
 @dataclass
 class ReviewFilter:
     min_chars: int = 40
@@ -16,19 +37,54 @@ class ReviewFilter:
         if len(t) < self.min_chars:
             return False
 
-        if not re.search(r"[A-Za-zА-Яа-яЁё0-9]", t):
-            return False
-
-        words = re.findall(r"[A-Za-zА-Яа-яЁё0-9]+", t)
-        if len(words) < self.min_words:
+        # at least one word is the same check as the old "any alphanumeric" search
+        if len(WORD_RE.findall(t)) < max(self.min_words, 1):
             return False
 
         if self.require_cyrillic and language == "russian":
-            letters = [ch for ch in t if ch.isalpha()]
+            letters = t.translate(CHAR_CLASSES)
             if not letters:
                 return False
-            cyr = sum(("а" <= ch.lower() <= "я") or (ch.lower() == "ё") for ch in letters)
-            if (cyr / len(letters)) < self.cyrillic_ratio:
+            if (letters.count("c") / len(letters)) < self.cyrillic_ratio:
                 return False
 
         return True
+
+    def accept_many(self, texts, language):
+        if hasattr(texts, "str"):
+            return self.accept_series(texts, language)
+
+        if isinstance(language, str):
+            return [self.accept(text, language) if isinstance(text, str) else False for text in texts]
+        return [self.accept(text, lang) if isinstance(text, str) else False for text, lang in zip(texts, language)]
+
+    def accept_series(self, texts, language):
+        is_text = texts.map(type) == str
+        t = texts.where(is_text, "").str.strip()
+
+        mask = is_text & (t.str.len() >= self.min_chars)
+        # each later check only looks at the rows that are still accepted
+        check = mask.copy()
+        mask[check] = t[check].str.count(WORD_PATTERN) >= max(self.min_words, 1)
+
+        if self.require_cyrillic:
+            if isinstance(language, str):
+                check = mask & (language == "russian")
+            else:
+                check = mask & (language == "russian").to_numpy()
+            letters = t[check].str.translate(CHAR_CLASSES)
+            n_letters = letters.str.len()
+            ratio = letters.str.count("c") / n_letters.where(n_letters > 0, 1)
+            mask[check] = (n_letters > 0) & (ratio >= self.cyrillic_ratio)
+
+        return mask
+
+
+def filter_csv(in_path, out_path, review_filter, language=None, text_column="review_text"):
+    import pandas as pd
+
+    df = pd.read_csv(in_path, dtype={text_column: object}, keep_default_na=False)
+    mask = review_filter.accept_series(df[text_column], df["language"] if language is None else language)
+    df[mask].to_csv(out_path, index=False)
+    print("Kept:", int(mask.sum()), "of", len(df))
+    return int(mask.sum())
@@ -0,0 +1,37 @@
+import sqlite3
+
+
+class ReviewIndex:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS reviews (
+                review_id TEXT PRIMARY KEY,
+                timestamp_updated INTEGER,
+                in_dataset INTEGER
+            )
+        ''')
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def known(self, review_ids) -> dict:
+        review_ids = list(review_ids)
+        if not review_ids:
+            return {}
+        placeholders = ", ".join("?" * len(review_ids))
+        rows = self.conn.execute(
+            f"SELECT review_id, timestamp_updated FROM reviews WHERE review_id IN ({placeholders})", review_ids
+        )
+        return dict(rows)
+
+    def upsert(self, items) -> None:
+        # items: (review_id, timestamp_updated, in_dataset)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO reviews (review_id, timestamp_updated, in_dataset) VALUES (?, ?, ?)",
+                ((review_id, ts, int(in_dataset)) for review_id, ts, in_dataset in items),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,90 +1,408 @@
+import os
 import csv
+import json
 import time
+import queue
+import random
+import threading
+from itertools import product
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from review_index import ReviewIndex
+
+FIELDNAMES = [
+    "review_id","review_text","voted_up","steam_purchase",
+    "playtime_hours","likes","funny_votes","weighted_vote_score","language"
+]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_DONE = object()
+
+
+class RateGate:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next_at)
+            self._next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def chain_key(language, flt):
+    return f"{language}:{flt}"
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
 
 class SteamReviewsParser:
-    def __init__(self, base_url: str, user_agent: str, sleep_seconds: float, review_filter):
+    def __init__(self, base_url: str, user_agent: str, sleep_seconds: float, review_filter, max_chains: int = 4,
+                 max_retries: int = 5, backoff_seconds: float = 1.0, backoff_cap: float = 60.0,
+                 global_rate: float = 10.0):
+        """sleep_seconds is the pause between pages of one cursor chain; global_rate caps requests
+        per second across all concurrent chains (default 10.0, None or 0 disables the cap)."""
         self.base_url = base_url
+        self.user_agent = user_agent
         self.sleep_seconds = sleep_seconds
         self.review_filter = review_filter
+        self.max_chains = max_chains
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_cap = backoff_cap
+        self.global_rate = global_rate
+
+        self.gate = RateGate(1.0 / global_rate if global_rate else 0)
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_chains)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": self.user_agent})
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._local.session = session
+        return session
+
+    def backoff(self, attempt, retry_after=None):
+        delay = min(self.backoff_cap, self.backoff_seconds * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def fetch_page(self, cursor, language, flt):
+        params = {
+            "json": 1,
+            "num_per_page": 100,
+            "cursor": cursor,
+            "language": language,
+            "filter": flt,
+            "review_type": "all",
+            "purchase_type": "all",
+        }
+
+        attempt = 0
+        while True:
+            self.gate.wait()
+            retry_after = None
+            try:
+                r = self.session.get(self.base_url, params=params, timeout=30)
+                if r.status_code in RETRY_STATUS:
+                    retry_after = r.headers.get("Retry-After")
+                    reason = f"HTTP {r.status_code}"
+                else:
+                    r.raise_for_status()
+                    return r.json()
+            except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+                reason = type(e).__name__
+
+            if attempt >= self.max_retries:
+                raise RuntimeError(f"{chain_key(language, flt)}: giving up after {attempt + 1} attempts ({reason})")
+            print("Retry:", chain_key(language, flt), reason)
+            self.backoff(attempt, retry_after)
+            attempt += 1
+
+    def make_row(self, rev, text, steam_purchase):
+        author = rev.get("author", {}) or {}
+        playtime_minutes = author.get("playtime_forever")
+
+        return {
+            "review_id": rev.get("recommendationid"),
+            "review_text": text,
+            "voted_up": rev.get("voted_up"),
+            "steam_purchase": steam_purchase,
+            "playtime_hours": (playtime_minutes / 60.0) if playtime_minutes is not None else None,
+            "likes": rev.get("votes_up"),
+            "funny_votes": rev.get("votes_funny"),
+            "weighted_vote_score": rev.get("weighted_vote_score"),
+            "language": rev.get("language"),
+        }
+
+    def page_rows(self, reviews, language, only_steam_purchase=True):
+        if only_steam_purchase:
+            reviews = [rev for rev in reviews if rev.get("steam_purchase", False)]
+        texts = [(rev.get("review") or "").strip() for rev in reviews]
+
+        return [
+            self.make_row(rev, text, rev.get("steam_purchase", False))
+            for rev, text, ok in zip(reviews, texts, self.review_filter.accept_many(texts, language))
+            if ok
+        ]
+
+    def iter_pages(self, total_count=100_000, language="russian", flt="all", only_steam_purchase=True,
+                   cursor="*", got=0):
+        while got < total_count:
+            data = self.fetch_page(cursor, language, flt)
+
+            reviews = data.get("reviews", [])
+            if not reviews:
+                yield [], cursor, got, True
+                return
+
+            rows = self.page_rows(reviews, language, only_steam_purchase)[:total_count - got]
+            got += len(rows)
+
+            prev_cursor = cursor
+            cursor = data.get("cursor", cursor)
+            done = got >= total_count or cursor == prev_cursor
+            yield rows, cursor, got, done
+            if done:
+                return
 
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": user_agent})
+            time.sleep(self.sleep_seconds)
 
     def iter_reviews(self, total_count=100_000, language="russian", flt="all", only_steam_purchase=True):
+        for rows, _, _, _ in self.iter_pages(total_count, language, flt, only_steam_purchase):
+            yield from rows
+
+    @staticmethod
+    def _put(out, stop, item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_chain(self, out, stop, total_count, language, flt, only_steam_purchase, cursor, got):
+        key = chain_key(language, flt)
+        try:
+            if stop.is_set():
+                return
+            for rows, cursor, got, done in self.iter_pages(total_count, language, flt, only_steam_purchase,
+                                                           cursor, got):
+                if not self._put(out, stop, (key, rows, cursor, got, done)):
+                    return
+        except Exception as e:
+            self._put(out, stop, e)
+        finally:
+            self._put(out, stop, _DONE)
+
+    def iter_pages_many(self, chains, total_count=100_000, only_steam_purchase=True, positions=None):
+        positions = positions or {}
+        chains = [(language, flt) for language, flt in chains
+                  if not positions.get(chain_key(language, flt), {}).get("done")]
+        if not chains:
+            return
+
+        out = queue.Queue(maxsize=max(16, 4 * len(chains)))
+        stop = threading.Event()
+        running = len(chains)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_chains, len(chains)))) as ex:
+            for language, flt in chains:
+                position = positions.get(chain_key(language, flt), {})
+                ex.submit(self._run_chain, out, stop, total_count, language, flt, only_steam_purchase,
+                          position.get("cursor", "*"), position.get("got", 0))
+            try:
+                while running:
+                    item = out.get()
+                    if item is _DONE:
+                        running -= 1
+                        continue
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                stop.set()
+
+    def iter_reviews_many(self, chains, total_count=100_000, only_steam_purchase=True):
+        seen = set()
+        for _, rows, _, _, _ in self.iter_pages_many(chains, total_count, only_steam_purchase):
+            for row in rows:
+                review_id = row["review_id"]
+                if review_id in seen:
+                    continue
+                seen.add(review_id)
+                yield row
+                if len(seen) >= total_count:
+                    return
+
+    def save_csv(self, path="stardew_reviews.csv", total_count=100_000, language="russian",
+                 flt="all", only_steam_purchase=True, resume=False, checkpoint_path=None, checkpoint_every=10):
+        languages = [language] if isinstance(language, str) else list(language)
+        filters = [flt] if isinstance(flt, str) else list(flt)
+        chains = list(product(languages, filters))
+        checkpoint_path = checkpoint_path or path + ".checkpoint.json"
+
+        state = load_checkpoint(checkpoint_path) if resume else None
+        if state is not None and os.path.exists(path):
+            f = open(path, "r+", newline="", encoding="utf-8")
+            f.truncate(state["size"])
+            f.seek(state["size"])
+            positions = state["chains"]
+            seen = set(state["seen"])
+            saved = state["saved"]
+            print("Resume:", saved, "rows,", sum(1 for p in positions.values() if p.get("done")), "chains done")
+        else:
+            f = open(path, "w", newline="", encoding="utf-8")
+            positions = {}
+            seen = set()
+            saved = 0
+
+        def checkpoint():
+            f.flush()
+            os.fsync(f.fileno())
+            save_checkpoint(checkpoint_path, {
+                "size": f.tell(),
+                "saved": saved,
+                "chains": positions,
+                "seen": list(seen),
+            })
+
+        with f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            if f.tell() == 0:
+                writer.writeheader()
+
+            pages = 0
+            try:
+                for key, rows, cursor, got, done in self.iter_pages_many(chains, total_count, only_steam_purchase,
+                                                                         positions):
+                    for row in rows:
+                        if saved >= total_count:
+                            break
+                        if row["review_id"] in seen:
+                            continue
+                        seen.add(row["review_id"])
+                        writer.writerow(row)
+                        saved += 1
+                        if saved % 1000 == 0:
+                            print("Saved:", saved)
+                    positions[key] = {"cursor": cursor, "got": got, "done": done}
+
+                    pages += 1
+                    if saved >= total_count:
+                        break
+                    if pages % checkpoint_every == 0:
+                        checkpoint()
+            except BaseException:
+                checkpoint()
+                print("Interrupted. Rows:", saved, "- rerun with resume=True to continue")
+                raise
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print("Done. Rows:", saved)
+
+    def iter_changes(self, index, language="russian", flt="updated", only_steam_purchase=True,
+                     stop_after=20, max_pages=None):
         cursor = "*"
-        got = 0
+        unchanged = 0
+        pages = 0
 
-        while got < total_count:
-            params = {
-                "json": 1,
-                "num_per_page": 100,
-                "cursor": cursor,
-                "language": language,
-                "filter": flt,
-                "review_type": "all",
-                "purchase_type": "all",
-            }
-
-            r = self.session.get(self.base_url, params=params, timeout=30)
-            r.raise_for_status()
-            data = r.json()
+        while max_pages is None or pages < max_pages:
+            data = self.fetch_page(cursor, language, flt)
+            pages += 1
 
             reviews = data.get("reviews", [])
             if not reviews:
-                break
+                return
 
+            known = index.known(rev.get("recommendationid") for rev in reviews)
+            changed = []
             for rev in reviews:
-                steam_purchase = rev.get("steam_purchase", False)
-                if only_steam_purchase and not steam_purchase:
-                    continue
+                ts = rev.get("timestamp_updated")
+                if known.get(rev.get("recommendationid")) == ts:
+                    unchanged += 1
+                else:
+                    unchanged = 0
+                    changed.append(rev)
 
-                text = (rev.get("review") or "").strip()
-                if not self.review_filter.accept(text, language=language):
-                    continue
+            rows = {row["review_id"]: row for row in self.page_rows(changed, language, only_steam_purchase)}
+            for rev in changed:
+                review_id = rev.get("recommendationid")
+                yield review_id, rev.get("timestamp_updated"), rows.get(review_id)
 
-                author = rev.get("author", {}) or {}
-                playtime_minutes = author.get("playtime_forever")
-
-                yield {
-                    "review_id": rev.get("recommendationid"),
-                    "review_text": text,
-                    "voted_up": rev.get("voted_up"),
-                    "steam_purchase": steam_purchase,
-                    "playtime_hours": (playtime_minutes / 60.0) if playtime_minutes is not None else None,
-                    "likes": rev.get("votes_up"),
-                    "funny_votes": rev.get("votes_funny"),
-                    "weighted_vote_score": rev.get("weighted_vote_score"),
-                    "language": rev.get("language"),
-                }
-
-                got += 1
-                if got >= total_count:
-                    break
+            if unchanged >= stop_after:
+                return
 
             prev_cursor = cursor
             cursor = data.get("cursor", cursor)
             if cursor == prev_cursor:
-                break
+                return
 
             time.sleep(self.sleep_seconds)
 
-    def save_csv(self, path="stardew_reviews.csv", total_count=100_000, language="russian",
-                 flt="all", only_steam_purchase=True):
-        fieldnames = [
-            "review_id","review_text","voted_up","steam_purchase",
-            "playtime_hours","likes","funny_votes","weighted_vote_score","language"
-        ]
+    def sync_csv(self, path="stardew_reviews.csv", language="russian", flt="updated", only_steam_purchase=True,
+                 index_path=None, stop_after=20, max_pages=None):
+        index = ReviewIndex(index_path or path + ".index.sqlite")
+        try:
+            changes = {}
+            for lang in ([language] if isinstance(language, str) else language):
+                for review_id, ts, row in self.iter_changes(index, lang, flt, only_steam_purchase,
+                                                            stop_after, max_pages):
+                    changes.setdefault(review_id, (ts, row))
+
+            if not changes:
+                print("Sync: no changes")
+                return
+
+            added = updated = removed = 0
+            tmp = path + ".part"
+            with open(tmp, "w", newline="", encoding="utf-8") as out:
+                writer = csv.DictWriter(out, fieldnames=FIELDNAMES)
+                writer.writeheader()
+
+                written = set()
+                if os.path.exists(path):
+                    with open(path, "r", newline="", encoding="utf-8") as f:
+                        for row in csv.DictReader(f):
+                            review_id = row["review_id"]
+                            if review_id in changes:
+                                new_row = changes[review_id][1]
+                                if new_row is None:
+                                    removed += 1
+                                    continue
+                                new_row = {k: "" if v is None else str(v) for k, v in new_row.items()}
+                                updated += new_row != row
+                                row = new_row
+                            written.add(review_id)
+                            writer.writerow(row)
 
-        saved = 0
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
+                for review_id, (ts, row) in changes.items():
+                    if row is not None and review_id not in written:
+                        writer.writerow(row)
+                        added += 1
 
-            for row in self.iter_reviews(total_count, language, flt, only_steam_purchase):
-                writer.writerow(row)
-                saved += 1
-                if saved % 1000 == 0:
-                    print("Saved:", saved)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, path)
 
-        print("Done. Rows:", saved)
\ No newline at end of file
+            index.upsert((review_id, ts, row is not None) for review_id, (ts, row) in changes.items())
+            print("Sync:", added, "new,", updated, "updated,", removed, "removed; index:", len(index))
+        finally:
+            index.close()
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-zа-яё0-9]+", re.IGNORECASE)
+
+PAD = "<pad>"
+UNK = "<unk>"
+PAD_ID = 0
+UNK_ID = 1
+
+CHUNK_SIZE = 2000
+
+_stoi = None
+_max_len = None
+
+
+def tokenize(s):
+    return TOKEN_RE.findall(str(s).lower())
+
+
+def _chunks(texts, size):
+    for i in range(0, len(texts), size):
+        yield texts[i:i + size]
+
+
+def _map_chunks(fn, texts, workers, initializer=None, initargs=()):
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(texts) <= CHUNK_SIZE:
+        if initializer is not None:
+            initializer(*initargs)
+        return [fn(chunk) for chunk in _chunks(texts, CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as ex:
+        return list(ex.map(fn, _chunks(texts, CHUNK_SIZE)))
+
+
+def _count_chunk(texts):
+    cnt = Counter()
+    for t in texts:
+        cnt.update(tokenize(t))
+    return cnt
+
+
+def build_vocab(texts, max_vocab=20000, min_freq=2, workers=None):
+    cnt = Counter()
+    for part in _map_chunks(_count_chunk, texts, workers):
+        cnt.update(part)
+
+    words = [w for w, c in cnt.items() if c >= min_freq]
+    words.sort(key=lambda w: (-cnt[w], w))
+    words = words[: max_vocab - 2]
+
+    return [PAD, UNK] + words
+
+
+def _init_encoder(stoi, max_len):
+    global _stoi, _max_len
+    _stoi = stoi
+    _max_len = max_len
+
+
+def _encode_chunk(texts):
+    flat = []
+    lengths = np.empty(len(texts), dtype=np.int32)
+    for i, t in enumerate(texts):
+        row = [_stoi.get(w, UNK_ID) for w in tokenize(t)[:_max_len]] or [UNK_ID]
+        flat.extend(row)
+        lengths[i] = len(row)
+
+    ids = np.full((len(texts), _max_len), PAD_ID, dtype=np.int32)
+    ids[np.arange(_max_len) < lengths[:, None]] = flat
+    return ids, lengths
+
+
+def encode_texts(texts, itos, max_len=160, workers=None):
+    stoi = {w: i for i, w in enumerate(itos)}
+    parts = _map_chunks(_encode_chunk, texts, workers, _init_encoder, (stoi, max_len))
+    if not parts:
+        return np.zeros((0, max_len), dtype=np.int32), np.zeros(0, dtype=np.int32)
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def corpus_fingerprint(splits, max_vocab, min_freq, max_len, vocab_split):
+    h = hashlib.sha1(json.dumps([max_vocab, min_freq, max_len, vocab_split, TOKEN_RE.pattern]).encode())
+    for name in sorted(splits):
+        h.update(name.encode() + b"\0")
+        for t in splits[name]:
+            h.update(str(t).encode("utf-8") + b"\0")
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+def _save_array(path, arr):
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def load_encoded(cache_dir, fingerprint=None):
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if fingerprint is not None and manifest["fingerprint"] != fingerprint:
+        return None
+
+    with open(os.path.join(cache_dir, "vocab.json"), "r", encoding="utf-8") as f:
+        itos = json.load(f)
+    data = {
+        name: (
+            np.load(os.path.join(cache_dir, f"{name}_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(cache_dir, f"{name}_lengths.npy"), mmap_mode="r"),
+        )
+        for name in manifest["splits"]
+    }
+    return itos, data
+
+
+def build_or_load(cache_dir, splits, max_vocab=20000, min_freq=2, max_len=160, vocab_split="train", workers=None):
+    splits = {name: [str(t) for t in texts] for name, texts in splits.items()}
+    fingerprint = corpus_fingerprint(splits, max_vocab, min_freq, max_len, vocab_split)
+
+    cached = load_encoded(cache_dir, fingerprint)
+    if cached is not None:
+        print("Tokens: loaded from", cache_dir)
+        return cached
+
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    itos = build_vocab(splits[vocab_split], max_vocab, min_freq, workers)
+    with open(os.path.join(cache_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(itos, f, ensure_ascii=False)
+
+    for name, texts in splits.items():
+        ids, lengths = encode_texts(texts, itos, max_len, workers)
+        _save_array(os.path.join(cache_dir, f"{name}_ids.npy"), ids)
+        _save_array(os.path.join(cache_dir, f"{name}_lengths.npy"), lengths)
+        print("Tokens:", name, ids.shape)
+
+    manifest = {
+        "fingerprint": fingerprint,
+        "splits": {name: len(texts) for name, texts in splits.items()},
+        "vocab_size": len(itos),
+        "max_vocab": max_vocab,
+        "min_freq": min_freq,
+        "max_len": max_len,
+        "pad_id": PAD_ID,
+        "unk_id": UNK_ID,
+    }
+    tmp = manifest_path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+    return load_encoded(cache_dir)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("csv")
+    ap.add_argument("cache_dir")
+    ap.add_argument("--column", default="review_text")
+    ap.add_argument("--max-vocab", type=int, default=20000)
+    ap.add_argument("--min-freq", type=int, default=2)
+    ap.add_argument("--max-len", type=int, default=160)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.csv)
+    itos, data = build_or_load(args.cache_dir, {"train": df[args.column].tolist()},
+                               args.max_vocab, args.min_freq, args.max_len, workers=args.workers)
+    print("Vocab:", len(itos))